@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016 Red Hat, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+""" Run per project commands in a pool of worker processes.
+
+Commands chdir and shell out to git so workers are processes, not
+threads. Each worker uses its own subdirectory of the workdir and the
+output of a project is buffered then returned as a whole.
+"""
+
+import os
+import sys
+import copy
+import tempfile
+import traceback
+import multiprocessing
+
+from Queue import Queue, Empty
+
+
+# Set in each worker by _init_worker
+_WORKER = {}
+
+
+def _init_worker(func, kargs):
+    _WORKER['func'] = func
+    _WORKER['kargs'] = kargs
+
+
+def _worker_kargs(kargs, project, workdir):
+    kargs = dict(kargs)
+    kargs['cmdargs'] = copy.copy(kargs['cmdargs'])
+    kargs['cmdargs'].name = project
+    kargs['workdir'] = workdir
+    return kargs
+
+
+def _run_project(project, extra=None):
+    kargs = _WORKER['kargs']
+    workdir = os.path.join(kargs['workdir'],
+                           multiprocessing.current_process().name)
+    if not os.path.isdir(workdir):
+        os.makedirs(workdir)
+    kargs = _worker_kargs(kargs, project, workdir)
+    kargs.update(extra or {})
+
+    out = tempfile.TemporaryFile()
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved = os.dup(1), os.dup(2)
+    os.dup2(out.fileno(), 1)
+    os.dup2(out.fileno(), 2)
+    ret, error = None, None
+    try:
+        ret = _WORKER['func'](**kargs)
+    except BaseException, e:
+        traceback.print_exc()
+        error = "%s: %s" % (type(e).__name__, e)
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.dup2(saved[0], 1)
+        os.dup2(saved[1], 2)
+        os.close(saved[0])
+        os.close(saved[1])
+    out.seek(0)
+    return project, ret, out.read(), error
+
+
+def run(func, projects, kargs, jobs=1):
+    """ Call func(**kargs) for each project with cmdargs.name set to it
+
+    Yield (project, result, output, error) tuples in completion order.
+    With jobs <= 1 projects are processed in sequence in the current
+    process, output is not captured and exceptions are not caught.
+    """
+    if jobs <= 1:
+        for project in projects:
+            kargs['cmdargs'].name = project
+            yield project, func(**kargs), None, None
+        return
+    pool = multiprocessing.Pool(jobs, _init_worker, (func, kargs))
+    try:
+        for result in pool.imap_unordered(_run_project, projects):
+            yield result
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
+# Error of the tasks not run because a task they depend on failed
+SKIPPED = 'skipped'
+
+
+def _run_task(task):
+    task_id, project, extra = task
+    return (task_id,) + _run_project(project, extra)
+
+
+def run_graph(func, tasks, kargs, jobs=1, ok=bool):
+    """ Call func(**kargs) for each task of a dependency graph
+
+    tasks is a list of (task_id, project, deps, extra) in dependency
+    order: cmdargs.name is set to project and the extra dict is merged
+    into kargs. A task is started once all its deps succeeded, as told by
+    ok(result). The first failure of a project skips its tasks not
+    started yet.
+
+    Yield (task_id, project, result, output, error) tuples in completion
+    order, error is SKIPPED for the skipped tasks. With jobs <= 1 the
+    tasks run in sequence in the current process and output is not
+    captured, exceptions are reported as errors in both cases.
+    """
+    done = {}
+    failed = set()
+    waiting = list(tasks)
+
+    def ready(limit=None):
+        """ Pop the tasks that can be started (up to limit) and the
+        skipped ones
+        """
+        start, skip = [], []
+        for task in list(waiting):
+            task_id, project, deps, extra = task
+            if project in failed or \
+                    any(d in done and not done[d] for d in deps):
+                skip.append(task)
+            elif len(start) == limit:
+                break
+            elif all(done.get(d) for d in deps):
+                start.append(task)
+            else:
+                continue
+            waiting.remove(task)
+        return start, skip
+
+    def complete(task_id, project, result, error):
+        done[task_id] = error is None and ok(result)
+        if not done[task_id]:
+            failed.add(project)
+
+    if jobs <= 1:
+        while waiting:
+            # One task at a time, keeping the order of tasks
+            start, skip = ready(1)
+            for task_id, project, _, _ in skip:
+                complete(task_id, project, None, SKIPPED)
+                yield task_id, project, None, None, SKIPPED
+            for task_id, project, _, extra in start:
+                ckargs = dict(kargs)
+                ckargs.update(extra)
+                ckargs['cmdargs'].name = project
+                result, error = None, None
+                try:
+                    result = func(**ckargs)
+                except KeyboardInterrupt:
+                    raise
+                except BaseException, e:
+                    # Reported as by the workers, for the caller to
+                    # clean up whatever the job count
+                    traceback.print_exc()
+                    error = "%s: %s" % (type(e).__name__, e)
+                complete(task_id, project, result, error)
+                yield task_id, project, result, None, error
+            if not start and not skip:
+                break
+        return
+
+    results = Queue()
+    pool = multiprocessing.Pool(jobs, _init_worker, (func, kargs))
+    try:
+        running = 0
+        while True:
+            start, skip = ready()
+            for task_id, project, _, _ in skip:
+                complete(task_id, project, None, SKIPPED)
+                yield task_id, project, None, None, SKIPPED
+            for task_id, project, _, extra in start:
+                pool.apply_async(_run_task, ((task_id, project, extra),),
+                                 callback=results.put)
+                running += 1
+            if skip and not start:
+                # Skipping may make other tasks skippable
+                continue
+            if not running:
+                break
+            try:
+                # A timeout keeps the wait interruptible
+                task_id, project, result, output, error = results.get(
+                    timeout=1)
+            except Empty:
+                continue
+            running -= 1
+            complete(task_id, project, result, error)
+            yield task_id, project, result, output, error
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
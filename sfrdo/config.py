@@ -31,3 +31,34 @@ username = 'Anonymous Coward'
 userpass = ''
 
 adminpass = ''
+
+# Parsed rdoinfo snapshots are kept under userdir. A snapshot is reused
+# without contacting the rdoinfo remote during that many seconds.
+rdoinfo_cache_ttl = 300
+
+# Bare mirrors of the repositories sfrdo clones are kept under userdir
+# and evicted (least recently used first) above that size in bytes.
+mirror_cache = True
+mirror_cache_budget = 20 * 1024 ** 3
+
+# Push all the branch updates of a repository with git push --atomic
+sync_atomic_push = True
+# The bare repositories used by the branch sync are kept under userdir
+# and evicted (least recently used first) above that size in bytes.
+sync_cache_budget = 5 * 1024 ** 3
+
+# Size of the RSA deploy keys created for the Github replication
+replication_key_bits = 4096
+# Seconds given to Gerrit to load a changed replication config. When the
+# loaded remotes cannot be listed over ssh, the replication is started
+# that many seconds after the change.
+replication_reload_wait = 15
+
+# Github API responses are cached under userdir, and reused without
+# revalidation during that many seconds
+github_cache_ttl = 24 * 3600
+
+# Share one ssh connection per user and host during a run (ControlMaster),
+# idle connections are kept open that many seconds
+ssh_mux = True
+ssh_mux_persist = 600
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016 Red Hat, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+""" Github API client for the lookups done in bulk by sfrdo.
+
+Requests are spread according to the X-RateLimit-* headers of each
+API resource (core, search) through a token bucket, so that concurrent
+lookups never hit the limits. Responses are kept on disk under
+config.userdir/github-cache and revalidated with If-None-Match, which
+does not count against the rate limit.
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+
+from multiprocessing.pool import ThreadPool
+
+import requests
+
+from sfrdo import config
+
+
+API = 'https://api.github.com'
+
+
+class RateLimitError(Exception):
+    pass
+
+
+class TokenBucket(object):
+    """ Allow rate requests per second with bursts of capacity """
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = capacity
+        self.tokens = capacity
+        self.stamp = time.time()
+        self.lock = threading.Lock()
+
+    def update(self, remaining, reset):
+        """ Spread the remaining requests until the limit reset time """
+        with self.lock:
+            self.rate = remaining / max(1.0, reset - time.time())
+            self.tokens = min(self.tokens, remaining)
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.time()
+                refill = (now - self.stamp) * self.rate
+                self.tokens = min(self.capacity, self.tokens + refill)
+                self.stamp = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / max(self.rate, 0.001)
+            time.sleep(min(wait, 60))
+
+
+class GithubClient(object):
+    def __init__(self, token=None, jobs=4, cache_ttl=None):
+        self.session = requests.Session()
+        if token:
+            self.session.headers['Authorization'] = 'token %s' % token
+        # Responses depend on the token (private repositories, rate
+        # limits), they are cached per token
+        self.token_key = hashlib.sha1(token or '').hexdigest()[:12]
+        self.jobs = jobs
+        self.cache_ttl = cache_ttl
+        if cache_ttl is None:
+            self.cache_ttl = config.github_cache_ttl
+        # Start conservative, the headers tell the real limits
+        self.buckets = {'core': TokenBucket(1, jobs),
+                        'search': TokenBucket(0.1, 1)}
+        self.stats = {'requests': 0, 'revalidated': 0, 'cached': 0,
+                      'exists': 0, 'exists_time': 0.0}
+        self._stats_lock = threading.Lock()
+        # Per run listings of organization repositories
+        self._orgs = {}
+
+    def _count(self, name, n=1):
+        """ Add n to stats[name], requests are made from many threads """
+        with self._stats_lock:
+            self.stats[name] += n
+
+    def _cache_path(self, url):
+        return os.path.join(config.userdir, 'github-cache',
+                            '%s-%s.json' % (self.token_key,
+                                            hashlib.sha1(url).hexdigest()))
+
+    def _load(self, url):
+        try:
+            with open(self._cache_path(url)) as fd:
+                return json.load(fd)
+        except (IOError, ValueError):
+            return None
+
+    def _store(self, url, entry):
+        path = self._cache_path(url)
+        if not os.path.isdir(os.path.dirname(path)):
+            try:
+                os.makedirs(os.path.dirname(path))
+            except OSError:
+                # Created by a concurrent request
+                pass
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'w') as f:
+            json.dump(entry, f)
+        os.rename(tmp, path)
+
+    def _bucket(self, path, resp=None):
+        name = 'search' if path.startswith('/search/') else 'core'
+        if resp is not None:
+            name = resp.headers.get('X-RateLimit-Resource', name)
+        return self.buckets.setdefault(name, TokenBucket(1, 1))
+
+    def get(self, path, ttl=None):
+        """ Return the decoded JSON of the GET of path
+
+        A cached response younger than ttl (default cache_ttl) seconds
+        is returned without request.
+        """
+        if ttl is None:
+            ttl = self.cache_ttl
+        url = API + path
+        entry = self._load(url)
+        if entry and time.time() - entry['time'] < ttl:
+            self._count('cached')
+            return entry['body']
+        headers = {}
+        if entry and entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        while True:
+            self._bucket(path).acquire()
+            resp = self.session.get(url, headers=headers)
+            self._count('requests')
+            bucket = self._bucket(path, resp)
+            remaining = resp.headers.get('X-RateLimit-Remaining')
+            reset = resp.headers.get('X-RateLimit-Reset')
+            if remaining is not None and reset is not None:
+                bucket.update(int(remaining), int(reset))
+            if resp.status_code in (403, 429) and remaining == '0':
+                wait = max(1, int(reset) - time.time())
+                if wait > 3600:
+                    raise RateLimitError(resp.text)
+                logging.debug("github: rate limited, waiting %ds" % wait)
+                time.sleep(wait)
+                continue
+            break
+        if resp.status_code == 304:
+            self._count('revalidated')
+            entry['time'] = time.time()
+            self._store(url, entry)
+            return entry['body']
+        resp.raise_for_status()
+        body = resp.json()
+        self._store(url, {'etag': resp.headers.get('ETag'),
+                          'time': time.time(), 'body': body})
+        return body
+
+    def list_all(self, path, ttl=0):
+        """ Return the items of all the pages of a listing """
+        items = []
+        sep = '&' if '?' in path else '?'
+        page = 1
+        while True:
+            batch = self.get('%s%sper_page=100&page=%d' % (path, sep, page),
+                             ttl)
+            items.extend(batch)
+            if len(batch) < 100:
+                return items
+            page += 1
+
+    def org_repos(self, org):
+        """ Return the set of the (lower case) repository names of org,
+        or None if org is not an organization. Listed once per run.
+        """
+        if org not in self._orgs:
+            start = time.time()
+            try:
+                self._orgs[org] = set(
+                    r['name'].lower()
+                    for r in self.list_all('/orgs/%s/repos' % org))
+            except requests.HTTPError:
+                self._orgs[org] = None
+            logging.debug("github: %s repositories listed in %.1fs" % (
+                org, time.time() - start))
+        return self._orgs[org]
+
+    def repo_exists(self, owner, name):
+        start = time.time()
+        try:
+            return self._repo_exists(owner, name)
+        finally:
+            self._count('exists')
+            self._count('exists_time', time.time() - start)
+
+    def _repo_exists(self, owner, name):
+        repos = self.org_repos(owner)
+        if repos is not None and name.lower() in repos:
+            return True
+        # Renamed or transferred repositories are not listed under their
+        # old name, but the API redirects to them
+        try:
+            self.get('/repos/%s/%s' % (owner, name), ttl=0)
+            return True
+        except requests.HTTPError:
+            return False
+
+    def repo_url_exists(self, url):
+        """ repo_exists for a https://github.com/<owner>/<name> URL """
+        owner, name = url.rstrip('/').split('/')[-2:]
+        return self.repo_exists(owner, name)
+
+    def map(self, func, items):
+        """ Return [func(item) for item in items], run concurrently """
+        pool = ThreadPool(self.jobs)
+        try:
+            return pool.map(func, items)
+        finally:
+            pool.close()
+            pool.join()
+
+
+_CLIENT = {}
+
+
+def client(token=None):
+    """ Return the GithubClient of the process for token (None for
+    anonymous requests)
+    """
+    if token not in _CLIENT:
+        _CLIENT[token] = GithubClient(token)
+    return _CLIENT[token]
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016 Red Hat, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+""" Local cache of bare mirrors of the git repositories sfrdo reads.
+
+Mirrors live under config.userdir/mirrors, one bare repository per
+remote URL. A mirror is refreshed with an incremental fetch at most once
+per process, then clones and fetches are served from the local disk.
+"""
+
+import os
+import time
+import fcntl
+import shutil
+import hashlib
+import logging
+
+from contextlib import contextmanager
+
+from rdopkg.helpers import cdir
+from rdopkg.utils.cmd import git
+from rdopkg.utils.exception import CommandFailed
+
+from sfrdo import config
+
+
+# Mirrors already refreshed (or created) by this process
+_REFRESHED = set()
+
+
+@contextmanager
+def lock(path, shared=False):
+    """ Exclusive (or shared) lock on path, with other sfrdo processes """
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    fd = open(path + '.lock', 'a')
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        yield
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        fd.close()
+
+
+def cache_dir():
+    path = os.path.join(config.userdir, 'mirrors')
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    return path
+
+
+def mirror_path(url):
+    return os.path.join(cache_dir(),
+                        '%s.git' % hashlib.sha1(url).hexdigest())
+
+
+def _create_mirror(url, path):
+    # Made under the lock of path, a leftover is removed by prune()
+    tmp = path + '.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    try:
+        git('init', '--bare', '-q', tmp)
+        with cdir(tmp):
+            git('remote', 'add', 'origin', url)
+            # Only heads and tags, Github pull refs are not wanted here
+            git('config', 'remote.origin.fetch',
+                '+refs/heads/*:refs/heads/*')
+            git('config', '--add', 'remote.origin.fetch',
+                '+refs/tags/*:refs/tags/*')
+            git('fetch', '--prune', 'origin')
+        os.rename(tmp, path)
+    except Exception:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+
+def mirror(url):
+    """ Return the path of an up to date bare mirror of url
+
+    When the cache is disabled url is returned as is.
+    """
+    if not config.mirror_cache:
+        return url
+    path = mirror_path(url)
+    with lock(path):
+        if path not in _REFRESHED:
+            start = time.time()
+            if os.path.isdir(path):
+                with cdir(path):
+                    git('fetch', '--prune', 'origin')
+            else:
+                _create_mirror(url, path)
+            _REFRESHED.add(path)
+            logging.debug("mirror of %s refreshed in %.3fs" % (
+                url, time.time() - start))
+        # Last use time for the LRU eviction
+        os.utime(path, None)
+    return path
+
+
+def clone(url, dest):
+    """ Same as git clone url dest but objects come from the mirror cache
+
+    The origin remote of the clone points to url. As mirrors are only
+    refreshed once per process, the clone then fetches from url what was
+    pushed there since (only the new objects are transferred).
+    """
+    src = mirror(url)
+    if src == url:
+        git('clone', src, dest)
+        return
+    # Not evicted while cloned from
+    with lock(src, shared=True):
+        git('clone', src, dest)
+    with cdir(dest):
+        git('remote', 'set-url', 'origin', url)
+        git('fetch', '--prune', '--tags', 'origin')
+        try:
+            git('reset', '-q', '--hard', '@{upstream}', log_fail=False)
+        except CommandFailed:
+            # Empty repository, or branch deleted from url
+            pass
+
+
+@contextmanager
+def checkout(url, dest, branch=None, fresh=False):
+    """ Lock dest and chdir into a checkout of url
+
+    A checkout left by a previous run (see --state-dir) is refreshed
+    with a fetch and a hard reset instead of being cloned again, unless
+    fresh is set. When branch is given it is checked out at
+    origin/branch.
+    """
+    dest = os.path.abspath(dest)
+    with lock(dest):
+        if not fresh and os.path.isdir(os.path.join(dest, '.git')):
+            with cdir(dest):
+                # Leftovers of an interrupted run
+                shutil.rmtree(os.path.join('.git', 'rebase-apply'),
+                              ignore_errors=True)
+                git('remote', 'set-url', 'origin', url)
+                git('fetch', '--prune', '--tags', 'origin')
+                git('reset', '-q', '--hard')
+                git('clean', '-q', '-fdx')
+        else:
+            if os.path.isdir(dest):
+                shutil.rmtree(dest)
+            clone(url, dest)
+        with cdir(dest):
+            if branch:
+                git('checkout', '-q', '-f', '-B', branch,
+                    'origin/%s' % branch)
+            yield dest
+
+
+def set_remote(name, url):
+    """ Add the remote name or update its URL if it already exists """
+    if name in git('remote', log_cmd=False).split():
+        git('remote', 'set-url', name, url)
+    else:
+        git('remote', 'add', name, url)
+
+
+def _du(path):
+    size = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            try:
+                size += os.lstat(os.path.join(root, f)).st_size
+            except OSError:
+                pass
+    return size
+
+
+def evict(root, budget, since=None):
+    """ Remove the least recently used (by mtime) repositories of root
+    until they fit in budget bytes
+
+    Repositories used after the since time are kept, and nothing is
+    evicted when none of them was.
+    """
+    if not os.path.isdir(root):
+        return
+    names = os.listdir(root)
+    for name in names:
+        if name.endswith('.git.tmp'):
+            # Left by an interrupted _create_mirror
+            path = os.path.join(root, name[:-len('.tmp')])
+            with lock(path):
+                shutil.rmtree(path + '.tmp', ignore_errors=True)
+    repos = []
+    for name in names:
+        if name.endswith('.git'):
+            path = os.path.join(root, name)
+            try:
+                repos.append((os.path.getmtime(path), path))
+            except OSError:
+                pass
+    if since is not None and not any(m >= since for m, _ in repos):
+        return
+    repos = [(mtime, _du(r), r) for mtime, r in repos]
+    total = sum(size for _, size, _ in repos)
+    for mtime, size, path in sorted(repos):
+        if total <= budget:
+            break
+        if since is not None and mtime >= since:
+            continue
+        with lock(path):
+            try:
+                used = os.path.getmtime(path) != mtime
+            except OSError:
+                used = False
+            if used:
+                # Used since it was listed
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+        total -= size
+        logging.debug("%s evicted (%s bytes)" % (path, size))
+
+
+def prune(budget=None, since=None):
+    """ Evict least recently used mirrors above the disk budget
+
+    Mirrors used after since (the start of the run) are never evicted.
+    """
+    if budget is None:
+        budget = config.mirror_cache_budget
+    evict(cache_dir(), budget, since)
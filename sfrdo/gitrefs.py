@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016 Red Hat, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+""" Per run snapshots of the branches and tags of remote repositories.
+
+A remote is listed with a single ls-remote the first time it is read.
+The snapshot is kept until invalidate() is called, which must be done
+after pushing to that remote.
+"""
+
+from rdopkg.utils.cmd import git
+
+
+_SNAPSHOTS = {}
+
+
+def refs(url):
+    """ Return a {refname: sha} dict of the heads and tags of url """
+    if url not in _SNAPSHOTS:
+        out = git('ls-remote', '--heads', '--tags', url, log_cmd=False)
+        snapshot = {}
+        for line in out.splitlines():
+            if line.strip():
+                sha, ref = line.split()
+                snapshot[ref] = sha
+        _SNAPSHOTS[url] = snapshot
+    return _SNAPSHOTS[url]
+
+
+def branch_sha(url, branch):
+    """ Return the sha of branch on url or None """
+    return refs(url).get('refs/heads/%s' % branch)
+
+
+def tags(url):
+    """ Return a {refs/tags/name: sha} dict of the tags of url """
+    return dict((ref, sha) for ref, sha in refs(url).items()
+                if ref.startswith('refs/tags/') and not ref.endswith('^{}'))
+
+
+def invalidate(url):
+    _SNAPSHOTS.pop(url, None)
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016 Red Hat, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+""" Branch sync engine working without checkouts.
+
+Each local (rpmfactory) repository gets a persistent bare repository
+under config.userdir/sync. Only the upstream refs to sync are fetched
+in it, then the SHAs are pushed directly to the local branches, all
+branches of a repository with a single push. Like the mirrors, these
+repositories are evicted least recently used first above
+config.sync_cache_budget.
+"""
+
+import os
+import hashlib
+
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from rdopkg.helpers import cdir
+from rdopkg.utils.cmd import git
+from rdopkg.utils.exception import CommandFailed
+
+from sfrdo import config
+from sfrdo import gitcache
+from sfrdo import gitrefs
+
+
+def _key(url):
+    return hashlib.sha1(url).hexdigest()
+
+
+def prune(budget=None, since=None):
+    """ Evict least recently used sync repositories above budget, except
+    those used after since
+    """
+    if budget is None:
+        budget = config.sync_cache_budget
+    gitcache.evict(os.path.join(config.userdir, 'sync'), budget, since)
+
+
+@contextmanager
+def sync_repo(local):
+    """ Lock and chdir into the persistent bare repository of local """
+    root = os.path.join(config.userdir, 'sync')
+    if not os.path.isdir(root):
+        os.makedirs(root)
+    path = os.path.join(root, '%s.git' % _key(local))
+    with gitcache.lock(path):
+        if not os.path.isdir(path):
+            git('init', '--bare', '-q', path)
+        # Last use time for the LRU eviction
+        os.utime(path, None)
+        with cdir(path):
+            yield path
+
+
+class BranchPlan(object):
+    """ Candidate upstream sources of local branches
+
+    Sources of a branch are added by increasing precedence: the last
+    one that exists upstream is the source the branch is synced from.
+    """
+    def __init__(self):
+        self.sources = OrderedDict()
+
+    def add(self, upstream, branch, rbranch):
+        self.sources.setdefault(branch, []).append((upstream, rbranch))
+
+    def entries(self):
+        """ Return all the (upstream, branch, rbranch) entries """
+        return [(upstream, branch, rbranch)
+                for branch, sources in self.sources.items()
+                for upstream, rbranch in sources]
+
+    def resolve(self):
+        """ Return {branch: (upstream, rbranch, sha) or None}
+
+        Sources are looked up in the run ref snapshots starting with
+        the one of highest precedence, so lower ones are usually never
+        listed.
+        """
+        winners = {}
+        for branch, sources in self.sources.items():
+            winners[branch] = None
+            for upstream, rbranch in reversed(sources):
+                sha = gitrefs.branch_sha(upstream, rbranch)
+                if sha:
+                    winners[branch] = (upstream, rbranch, sha)
+                    break
+        return winners
+
+
+def _upstream_ref(upstream, rbranch):
+    return 'refs/sfrdo/%s/heads/%s' % (_key(upstream)[:12], rbranch)
+
+
+def _push_status(out):
+    """ Return {ref: error or None} from the output of push --porcelain """
+    status = {}
+    for line in str(out).splitlines():
+        fields = line.split('\t')
+        if len(fields) >= 3 and ':' in fields[1]:
+            ref = fields[1].split(':', 1)[1]
+            status[ref] = fields[2] if fields[0] == '!' else None
+    return status
+
+
+def _push(local, refspecs):
+    """ Push refspecs to local, return {ref: error} for the refs rejected
+    by a non atomic push. Raise CommandFailed if nothing was pushed.
+    """
+    push = ['push', '-f']
+    if config.sync_atomic_push and len(refspecs) > 1:
+        try:
+            git(*(push + ['--atomic', local] + refspecs))
+            return {}
+        except CommandFailed, e:
+            out = e.kwargs.get('out', '')
+            # git reports "the receiving end does not support --atomic
+            # push" on stderr
+            if '--atomic' not in '%s%s' % (out, getattr(out, 'stderr', '')):
+                raise
+            # The remote does not support atomic pushes
+    try:
+        git(*(push + ['--porcelain', local] + refspecs))
+    except CommandFailed, e:
+        # Some refs may have been updated
+        status = _push_status(e.kwargs.get('out', ''))
+        if not any(status.values()):
+            raise
+        return dict((ref, error) for ref, error in status.items() if error)
+    return {}
+
+
+def sync_branches(local, updates):
+    """ Set local branches to the heads of upstream branches
+
+    updates is a list of (branch, upstream, rbranch, l_ref) where l_ref
+    is the current sha of local:branch or None if the branch does not
+    exist yet. A local branch must appear only once.
+
+    All upstream refs are fetched with one fetch per upstream, then
+    pushed with a single push. Return a {branch: (sha, difflog, error)}
+    dict where difflog is the list of commits added to the branch
+    (empty when the branch is created) and error is None on success.
+    When the push is not atomic, only the rejected branches get an error.
+    """
+    results = {}
+    by_upstream = {}
+    for branch, upstream, rbranch, l_ref in updates:
+        by_upstream.setdefault(upstream, []).append(
+            (branch, rbranch, l_ref))
+    with sync_repo(local):
+        fetched = []
+        for upstream, bupdates in by_upstream.items():
+            refspecs = ['+refs/heads/%s:%s' % (
+                rbranch, _upstream_ref(upstream, rbranch))
+                for _, rbranch, _ in bupdates]
+            try:
+                git(*(['fetch', '--no-tags', upstream] + refspecs))
+            except CommandFailed, e:
+                for branch, _, _ in bupdates:
+                    results[branch] = (None, [], e)
+                continue
+            for branch, rbranch, l_ref in bupdates:
+                sha = git('rev-parse', _upstream_ref(upstream, rbranch),
+                          log_cmd=False)
+                fetched.append((branch, sha, l_ref))
+        if not fetched:
+            return results
+
+        difflogs = dict((branch, []) for branch, _, _ in fetched)
+        existing = [branch for branch, _, l_ref in fetched if l_ref]
+        error = None
+        rejected = {}
+        try:
+            if existing:
+                refspecs = ['+refs/heads/%s:refs/sfrdo/local/heads/%s' % (
+                    b, b) for b in existing]
+                git(*(['fetch', '--no-tags', local] + refspecs))
+            for branch, sha, l_ref in fetched:
+                if l_ref:
+                    difflogs[branch] = git(
+                        '--no-pager', 'log', '--oneline',
+                        '%s..%s' % (l_ref, sha)).split('\n')
+            rejected = _push(local, ['%s:refs/heads/%s' % (sha, branch)
+                                     for branch, sha, _ in fetched])
+        except CommandFailed, e:
+            error = e
+        finally:
+            gitrefs.invalidate(local)
+        for branch, sha, _ in fetched:
+            results[branch] = (sha, difflogs[branch], error or rejected.get(
+                'refs/heads/%s' % branch))
+    return results
+
+
+def missing_tags(local, upstream):
+    """ Return the tag refs of upstream that local does not have """
+    local_tags = gitrefs.tags(local)
+    return sorted(ref for ref in gitrefs.tags(upstream)
+                  if ref not in local_tags)
+
+
+def sync_tags(local, upstream, tags, chunk=200):
+    """ Fetch tags (refs) from upstream and push them to local """
+    with sync_repo(local):
+        try:
+            for i in range(0, len(tags), chunk):
+                refspecs = ['+%s:%s' % (ref, ref) for ref in tags[i:i + chunk]]
+                git(*(['fetch', '--no-tags', upstream] + refspecs))
+                git(*(['push', local] + ['%s:%s' % (ref, ref)
+                                         for ref in tags[i:i + chunk]]))
+        finally:
+            gitrefs.invalidate(local)
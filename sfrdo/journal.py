@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016 Red Hat, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+""" Append-only journal of the work done by batch commands.
+
+A run records its project list, then each (project, step) it completes,
+as JSON lines keyed by the command and its selection arguments. A run
+resumed with the same key takes the recorded project list and skips the
+completed steps, without computing anything from the network.
+
+The key lists the selection arguments in a fixed order, whatever their
+order on the command line. Starting a new run drops the records of the
+previous runs of the same key, so the journal only keeps the last run of
+each key.
+"""
+
+import os
+import json
+import time
+import tempfile
+
+from sfrdo import gitcache
+
+
+class Journal(object):
+    def __init__(self, path, key, resume=False):
+        self.path = path
+        self.key = key
+        # Project list of the run being resumed
+        self.resumed = None
+        self.completed = set()
+        if resume:
+            self._load()
+
+    def _load(self):
+        if not os.path.isfile(self.path):
+            return
+        with open(self.path) as fd:
+            for line in fd:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    # Last line of an interrupted write
+                    continue
+                if rec.get('key') != self.key:
+                    continue
+                if rec['type'] == 'start':
+                    self.resumed = rec['projects']
+                    self.completed = set()
+                elif rec['type'] == 'done':
+                    self.completed.add((rec['project'], rec['step']))
+                elif rec['type'] == 'reset':
+                    self._forget(rec['project'])
+
+    def _forget(self, project):
+        self.completed = set((p, s) for p, s in self.completed
+                             if p != project)
+
+    def _compact(self):
+        """ Drop the records of the previous runs of the key """
+        if not os.path.isfile(self.path):
+            return
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path))
+        with os.fdopen(fd, 'w') as out:
+            with open(self.path) as journal:
+                for line in journal:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        continue
+                    if rec.get('key') != self.key:
+                        out.write(line.rstrip('\n') + '\n')
+            out.flush()
+            os.fsync(out.fileno())
+        os.rename(tmp, self.path)
+
+    def _append(self, rec, compact=False):
+        rec['key'] = self.key
+        rec['time'] = time.time()
+        with gitcache.lock(self.path):
+            if compact:
+                self._compact()
+            self._write(rec)
+
+    def _write(self, rec):
+        with open(self.path, 'a+') as fd:
+            line = json.dumps(rec) + '\n'
+            fd.seek(0, os.SEEK_END)
+            if fd.tell():
+                fd.seek(-1, os.SEEK_END)
+                if fd.read(1) != '\n':
+                    # Do not extend a line left truncated by a crash
+                    line = '\n' + line
+            fd.write(line)
+            fd.flush()
+            os.fsync(fd.fileno())
+
+    def projects(self, fetch):
+        """ Return the project list of the resumed run, or fetch() it and
+        start a new run with it
+        """
+        if self.resumed is not None:
+            print "Resume %s: %s projects, %s steps already done" % (
+                self.key, len(self.resumed), len(self.completed))
+            return list(self.resumed)
+        projects = list(fetch())
+        self._append({'type': 'start', 'projects': projects}, compact=True)
+        self.completed = set()
+        return projects
+
+    def is_done(self, project, step='all'):
+        return (project, step) in self.completed
+
+    def pending(self, projects, step='all'):
+        """ Return the projects for which step is not done """
+        todo = [p for p in projects if not self.is_done(p, step)]
+        if len(todo) != len(projects):
+            print "Skip %s projects done by a previous run" % (
+                len(projects) - len(todo))
+        return todo
+
+    def done(self, project, step='all'):
+        self._append({'type': 'done', 'project': project, 'step': step})
+        self.completed.add((project, step))
+
+    def reset(self, project):
+        """ Forget the steps done for project, to redo them all """
+        self._append({'type': 'reset', 'project': project})
+        self._forget(project)
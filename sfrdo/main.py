@@ -16,12 +16,10 @@
 
 import os
 import sys
-import json
+import time
 import yaml
 import shlex
-import shutil
 import logging
-import requests
 import tempfile
 import argparse
 import subprocess
@@ -31,16 +29,25 @@ from rdopkg.helpers import setenv
 from rdopkg.utils.cmd import git
 
 from copy import deepcopy
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
 
 try:
     from rpmUtils.miscutils import splitFilename
 except:
     pass
 
+from sfrdo import batch
 from sfrdo import config
+from sfrdo import ghclient
+from sfrdo import gitcache
+from sfrdo import gitrefs
+from sfrdo import gitsync
+from sfrdo import journal
 from sfrdo import msfutils
 from sfrdo import osreleases
 from sfrdo import rdoinfoutils
+from sfrdo import sshmux
 
 
 logging.basicConfig(filename='warns.log', level=logging.DEBUG)
@@ -49,6 +56,15 @@ logging.basicConfig(filename='warns.log', level=logging.DEBUG)
 BL = []
 
 
+SF_ADMIN_MAIL = 'admin@rpmfactory.beta.rdoproject.org'
+
+
+# Steps of a project import and the steps they depend on
+IMPORT_STEPS = OrderedDict([('distgit', []), ('mirror', []),
+                            ('patches', ['distgit', 'mirror']),
+                            ('maints', ['patches'])])
+
+
 NOT_IN_LIBERTY = ['cloudkittyclient', 'openstacksdk',
                   'mistralclient', 'os-win', 'ironic-lib', 'octavia',
                   'cloudkitty', 'mistral', 'osprofiler', 'pysaml2',
@@ -76,18 +92,16 @@ class PRequestedTagDoesNotExists(Exception):
 
 
 def fetch_all_project_type(rdoinfo, t='None'):
-    select = [pkg for pkg in rdoinfo['packages']]
-    if t == 'All':
-        return [p['project'] for p in select]
-    if t == 'None':
-        return [p['project'] for p in select if
-                'conf' not in p]
-    else:
-        return [p['project'] for p in select if
-                'conf' in p and p['conf'] == t]
+    return rdoinfoutils.get_index(rdoinfo).projects_of_type(t)
 
 
 def create_baseproject(msf, name, desc):
+    # Concurrent imports create projects one at a time
+    with gitcache.lock(os.path.join(config.userdir, 'locks', 'projects')):
+        _create_baseproject(msf, name, desc)
+
+
+def _create_baseproject(msf, name, desc):
     print "Delete previous %s" % name
     msf.deleteProject(name)
     print "Create %s" % name
@@ -112,6 +126,16 @@ def sync_and_push_branch(rfrom, rto, branch, tbranch=None):
         git('checkout', '-b', tbranch)
     git('reset', '--hard', 'remotes/%s/%s' % (rfrom, branch))
     git('push', '-f', rto, tbranch)
+    pushed(rto)
+
+
+def pushed(remote):
+    """ Forget the ref snapshots of remote of the current checkout, and of
+    its origin (the same rpmfactory repository over http), after a push
+    """
+    for name in (remote, 'origin'):
+        gitrefs.invalidate(git('config', 'remote.%s.url' % name,
+                               log_cmd=False))
 
 
 def fetch_flat_patches(name):
@@ -152,14 +176,9 @@ def is_branches_exists(expected_remotes_branches):
 
 
 def is_branch_exists(upstream, branch):
-    """ Only use git ls-remote
+    """ Only use git ls-remote (through the run ref snapshots)
     """
-    try:
-        [l.split()[0] for l in git('ls-remote', upstream).split('\n')
-         if l.endswith('refs/heads/%s' % branch)][0]
-    except IndexError:
-        return False
-    return True
+    return gitrefs.branch_sha(upstream, branch) is not None
 
 
 def import_distgit(msf, sfgerrit, sfdistgit, distgit, mdistgit,
@@ -172,18 +191,17 @@ def import_distgit(msf, sfgerrit, sfdistgit, distgit, mdistgit,
     except msfutils.SFManagerException, e:
         print "Unable to create %s: %s" % (sfdistgit, e)
         sys.exit(1)
-    with cdir(workdir):
-        git('clone', 'http://%s/r/%s' % (config.rpmfactory, sfdistgit),
-            sfdistgit)
-    if conf == 'rpmfactory-puppet':
-        # Nothing to do here
-        return
-    with cdir(os.path.join(workdir, sfdistgit)):
+    # The project has just been created, do not reuse a previous checkout
+    with gitcache.checkout('http://%s/r/%s' % (config.rpmfactory, sfdistgit),
+                           os.path.join(workdir, sfdistgit), fresh=True):
+        if conf == 'rpmfactory-puppet':
+            # Nothing to do here
+            return
         # Set remotes and fetch objects
         git('remote', 'add', 'gerrit', sfgerrit + sfdistgit)
         if in_liberty:
-            git('remote', 'add', 'upstream', distgit)
-        git('remote', 'add', 'upstream-mdistgit', mdistgit)
+            git('remote', 'add', 'upstream', gitcache.mirror(distgit))
+        git('remote', 'add', 'upstream-mdistgit', gitcache.mirror(mdistgit))
         git('fetch', 'gerrit')
         if in_liberty:
             git('fetch', 'upstream')
@@ -220,13 +238,11 @@ def import_mirror(msf, sfgerrit, name, upstream, workdir, in_liberty=True):
     except msfutils.SFManagerException, e:
         print "Unable to create %s: %s" % (name, e)
         sys.exit(1)
-    with cdir(workdir):
-        git('clone', 'http://%s/r/%s' % (config.rpmfactory, name),
-            name)
-    with cdir(os.path.join(workdir, name)):
+    with gitcache.checkout('http://%s/r/%s' % (config.rpmfactory, name),
+                           os.path.join(workdir, name), fresh=True):
         # Set remotes and fetch objects
         git('remote', 'add', 'gerrit', sfgerrit + name)
-        git('remote', 'add', 'upstream', upstream)
+        git('remote', 'add', 'upstream', gitcache.mirror(upstream))
         git('fetch', '--all')
 
         # Assert expected branches exists
@@ -243,6 +259,7 @@ def import_mirror(msf, sfgerrit, name, upstream, workdir, in_liberty=True):
         # sync and push to rpmfactory
         sync_and_push_branch('upstream', 'gerrit', 'master')
         git('push', 'gerrit', '--tags')
+        pushed('gerrit')
 
 
 def update_patches_branch_and_reviews(distgit, mirror, distgit_branch,
@@ -253,12 +270,10 @@ def update_patches_branch_and_reviews(distgit, mirror, distgit_branch,
     distgit patches exists then they are published as gerrit changes.
     """
     assert workdir is not None
-    with cdir(workdir):
-        git('clone', 'http://%s/r/%s' % (config.rpmfactory, distgit),
-            distgit)
-    with cdir(os.path.join(workdir, distgit)):
+    with gitcache.checkout('http://%s/r/%s' % (config.rpmfactory, distgit),
+                           os.path.join(workdir, distgit)):
         is_branches_exists([('origin', distgit_branch)])
-        git('checkout', distgit_branch)
+        git('checkout', '-B', distgit_branch, 'origin/' + distgit_branch)
         # Fetch upstream tag based on the spec file
         name = mirror
         if name in rdoinfoutils.RDOINFOS_FIXES and \
@@ -270,10 +285,8 @@ def update_patches_branch_and_reviews(distgit, mirror, distgit_branch,
         flat_patches = list(fetch_flat_patches(mirror))
         print "Upstream version used in the spec is %s" % version
         print "%s distgit patches detected" % len(flat_patches)
-    with cdir(workdir):
-        git('clone', 'http://%s/r/%s' % (config.rpmfactory, mirror),
-            mirror)
-    with cdir(os.path.join(workdir, mirror)):
+    with gitcache.checkout('http://%s/r/%s' % (config.rpmfactory, mirror),
+                           os.path.join(workdir, mirror)):
         version_sha = git('--no-pager', 'log', '-1', '--format=%H', version)
         print "Upstream version used in the spec is %s (%s)" % (
               version, version_sha)
@@ -281,14 +294,16 @@ def update_patches_branch_and_reviews(distgit, mirror, distgit_branch,
         patches_branch_sha = git('--no-pager', 'log', '-1', '--format=%H',
                                  'origin/' + patches_branch)
         print "%s head is %s" % (patches_branch, patches_branch_sha)
-        git('remote', 'add', 'gerrit', 'ssh://%s@%s:29418/%s' %
-            (config.service_user_name, config.rpmfactory, mirror))
-        git('checkout', patches_branch)
+        gitcache.set_remote('gerrit', 'ssh://%s@%s:29418/%s' %
+                            (config.service_user_name, config.rpmfactory,
+                             mirror))
+        git('checkout', '-B', patches_branch, 'origin/' + patches_branch)
         if version_sha != patches_branch_sha:
             print "%s branch need an update to %s" % (patches_branch,
                                                       version_sha)
             git('reset', '--hard', version_sha)
             git('push', '-f', 'gerrit', patches_branch)
+            pushed('gerrit')
         else:
             print "%s branch is up to date" % patches_branch
         if flat_patches:
@@ -333,12 +348,11 @@ def get_repo_infos(repo='openstack-liberty'):
 
 def project_check_distgit_branch(cmdargs, workdir, rdoinfo):
     def get_spec_infos(sfdistgit, distgit_branch):
-        with cdir(workdir):
-            git('clone', 'http://%s/r/%s' % (config.rpmfactory, sfdistgit),
-                sfdistgit)
-        with cdir(os.path.join(workdir, sfdistgit)):
+        with gitcache.checkout('http://%s/r/%s' % (config.rpmfactory,
+                                                   sfdistgit),
+                               os.path.join(workdir, sfdistgit)):
             is_branches_exists([('origin', distgit_branch)])
-            git('checkout', distgit_branch)
+            git('checkout', '-B', distgit_branch, 'origin/' + distgit_branch)
             p = subprocess.Popen('rpm -q --specfile *.spec',
                                  stdout=subprocess.PIPE,
                                  stderr=subprocess.STDOUT, shell=True)
@@ -368,12 +382,12 @@ def project_check_distgit_branch(cmdargs, workdir, rdoinfo):
             return fetch_upstream_tag_name(), repo_version
     status = []
     repo_infos = get_repo_infos()
+    index = rdoinfoutils.get_index(rdoinfo)
     for project in cmdargs.name:
-        select = [pkg for pkg in rdoinfo['packages']
-                  if pkg['project'] == project][0]
-        mdistgit = select['master-distgit']
-        sfdistgit = "%s-distgit" % select['project']
-        conf = select.get('conf', None)
+        infos = index.get(project)
+        mdistgit = infos.mdistgit
+        sfdistgit = infos.sfdistgit
+        conf = index.package(project).get('conf', None)
         # Check on the distgit (RPMFactory)
         on_rpmf = is_branch_exists('http://%s/r/%s' % (
                                    config.rpmfactory, sfdistgit),
@@ -412,8 +426,11 @@ def project_check_distgit_branch(cmdargs, workdir, rdoinfo):
 def set_patches_on_mirror(msf, sfgerrit, name, sfdistgit,
                           workdir):
     print "=== Compute and create the patches branch on mirror ==="
-    with cdir(os.path.join(workdir, sfdistgit)):
-        git('checkout', 'rdo-liberty')
+    # Checkouts of the previous steps are refreshed, or made again when
+    # these steps were done by a previous run (--resume)
+    with gitcache.checkout('http://%s/r/%s' % (config.rpmfactory, sfdistgit),
+                           os.path.join(workdir, sfdistgit),
+                           branch='rdo-liberty'):
         # Fetch flats file patches
         flat_patches = list(fetch_flat_patches(name))
         print "%s owns %s patches" % (sfdistgit, len(flat_patches))
@@ -426,7 +443,9 @@ def set_patches_on_mirror(msf, sfgerrit, name, sfdistgit,
         else:
             version = fetch_upstream_tag_name()
         print "%s packaging is based on tag %s" % (sfdistgit, version)
-    with cdir(os.path.join(workdir, name)):
+    with gitcache.checkout('http://%s/r/%s' % (config.rpmfactory, name),
+                           os.path.join(workdir, name)):
+        gitcache.set_remote('gerrit', sfgerrit + name)
         print "Create %s based on tag %s" % ('liberty-patches', version)
         try:
             git('checkout', version)
@@ -439,6 +458,7 @@ def set_patches_on_mirror(msf, sfgerrit, name, sfdistgit,
                     "%s is missing. But patches rely on it" % (version))
         git('checkout', '-B', 'liberty-patches')
         git('push', '-f', 'gerrit', 'liberty-patches')
+        pushed('gerrit')
 
         print "Apply detected patches (%s)" % len(flat_patches)
         flat_patches.sort()
@@ -449,154 +469,267 @@ def set_patches_on_mirror(msf, sfgerrit, name, sfdistgit,
             git('review', '-i', '-y', 'liberty-patches')
 
 
-def check_upstream_and_sync(name, workdir, local, branch,
-                            upstream, rbranch=None, push_tags=False):
-    if not rbranch:
-        rbranch = branch
-    print "Attempt to sync %s:%s from %s:%s" % (local, branch,
-                                                upstream, rbranch)
+def check_upstreams_and_sync(local, plan, dry_run=False):
+    """ Sync local branches from the winning sources of a BranchPlan
 
-    try:
-        u_ref = [l.split()[0] for l in git('ls-remote', upstream).split('\n')
-                 if l.endswith('refs/heads/%s' % rbranch)][0]
-    except IndexError:
-        # Set code to 0 avoid exiting with an error code
-        return [0, "[SKIPPED] remote branch not found %s:%s " % (upstream,
-                                                                 rbranch)]
-    try:
-        l_ref = [l.split()[0] for l in git('ls-remote', local).split('\n')
-                 if l.endswith('refs/heads/%s' % branch)][0]
-    except IndexError:
-        l_ref = 0
+    The needed ref updates are computed first from the run ref
+    snapshots, then sent with one fetch per upstream and a single push.
+    Return a {(upstream, branch, rbranch): status} dict covering every
+    entry of the plan. With dry_run the plan is only displayed.
+    """
+    statuses = {}
+    l_refs = {}
+    pending = {}
+    winners = plan.resolve()
+    print "Branch plan for %s:" % local
+    for branch, sources in plan.sources.items():
+        winner = winners[branch]
+        for upstream, rbranch in sources:
+            if winner and (upstream, rbranch) == winner[:2]:
+                mark = '*'
+            else:
+                mark = ' '
+            print " %s %s <- %s:%s" % (mark, branch, upstream, rbranch)
+            if winner is None:
+                # Set code to 0 avoid exiting with an error code
+                statuses[(upstream, branch, rbranch)] = [
+                    0, "[SKIPPED] remote branch not found %s:%s " % (
+                        upstream, rbranch)]
+            elif mark != '*':
+                statuses[(upstream, branch, rbranch)] = [
+                    0, "[SKIPPED] superseded by %s:%s" % winner[:2]]
+
+    for branch, winner in winners.items():
+        if winner is None:
+            continue
+        upstream, rbranch, u_ref = winner
+        print "Attempt to sync %s:%s from %s:%s" % (local, branch,
+                                                    upstream, rbranch)
+        l_ref = gitrefs.branch_sha(local, branch)
+        l_refs[branch] = l_ref
+        if l_ref == u_ref:
+            print "Branch is up to date. Nothing to do."
+            statuses[(upstream, branch, rbranch)] = [
+                0, "[UP TO DATE] compared to %s:%s" % (upstream, rbranch)]
+        elif dry_run:
+            statuses[(upstream, branch, rbranch)] = [
+                0, "[PLANNED] sync from %s:%s" % (upstream, rbranch)]
+        else:
+            print "Need a sync [l:%s != u:%s]" % (l_ref or 0, u_ref)
+            pending[branch] = (upstream, rbranch)
 
-    if l_ref == u_ref:
-        print "Branch is up to date. Nothing to do."
-    else:
-        print "Need a sync [l:%s != u:%s]" % (l_ref, u_ref)
-        pdir = os.path.join(workdir, name)
-        # Clean previous if exist
-        if os.path.isdir(pdir):
-            shutil.rmtree(pdir)
-        try:
-            with cdir(workdir):
-                # git('clone', 'http://%s/r/%s' % (config.rpmfactory, name),
-                #     name)
-                git('clone', local, name)
-            with cdir(pdir):
-                # Set remotes and fetch objects
-                git('remote', 'add', 'local', local)
-                git('remote', 'add', 'upstream', upstream)
-                git('fetch', '--all')
-                if l_ref != 0:
-                    difflog = git('--no-pager', 'log', '--oneline', '%s..%s' %
-                                  (l_ref, u_ref)).split('\n')
-                    for cmsg in difflog:
-                        print cmsg
-                sync_and_push_branch('upstream', 'local',
-                                     rbranch, branch)
-                if push_tags:
-                    git('push', 'local', '--tags')
-        except Exception, e:
-            return [1, "[FAILED] Sync from %s:%s (%s)" % (upstream,
-                                                          rbranch, e)]
-
-        if l_ref == 0:
+    if not pending:
+        return statuses
+    updates = [(branch, source[0], source[1], l_refs[branch])
+               for branch, source in pending.items()]
+    try:
+        results = gitsync.sync_branches(local, updates)
+    except Exception, e:
+        results = dict((branch, (None, [], e)) for branch in pending)
+    for branch, (upstream, rbranch) in pending.items():
+        _, difflog, error = results[branch]
+        if error:
+            statuses[(upstream, branch, rbranch)] = [
+                1, "[FAILED] Sync from %s:%s (%s)" % (upstream, rbranch,
+                                                      error)]
+            continue
+        print "Synced %s:%s from %s:%s" % (local, branch, upstream, rbranch)
+        for cmsg in difflog:
+            print cmsg
+        if not l_refs[branch]:
             difflog = "BRANCH CREATED"
         else:
             difflog = "%s COMMIT(S)" % len(difflog)
-        return [0, "[SYNC SUCCEED: %s] synced from %s:%s" % (
-            difflog, upstream, rbranch)]
-    return [0, "[UP TO DATE] compared to %s:%s" % (upstream, rbranch)]
+        statuses[(upstream, branch, rbranch)] = [
+            0, "[SYNC SUCCEED: %s] synced from %s:%s" % (
+                difflog, upstream, rbranch)]
+    return statuses
 
 
-def project_import(cmdargs, workdir, rdoinfo):
+def check_tags_and_sync(local, upstream, dry_run=False):
+    """ Push to local the tags of upstream it does not have yet
+    """
+    print "Attempt to sync %s tags from %s" % (local, upstream)
+    try:
+        missing = gitsync.missing_tags(local, upstream)
+        if not missing:
+            print "Tags are up to date. Nothing to do."
+            return [0, "[UP TO DATE] tags compared to %s" % upstream]
+        print "Missing tags: %s" % ", ".join(
+            [ref[len('refs/tags/'):] for ref in missing])
+        if dry_run:
+            return [0, "[PLANNED] %s TAG(S) to add from %s" % (
+                len(missing), upstream)]
+        gitsync.sync_tags(local, upstream, missing)
+    except Exception, e:
+        return [1, "[FAILED] Tags sync from %s (%s)" % (upstream, e)]
+    return [0, "[SYNC SUCCEED: %s TAG(S) ADDED] synced from %s" % (
+        len(missing), upstream)]
+
+
+def project_import_check(cmdargs, workdir, rdoinfo):
+    """ Return True if the project must be imported """
     print "\n=== Start import ==="
-    name, distgit, upstream, \
-        sfdistgit, maints, conf, mdistgit = \
-        rdoinfoutils.fetch_project_infos(rdoinfo, cmdargs.name)
-
-    sfgerrit = config.gerrit_rpmfactory % config.userlogin
-
-    in_liberty = True
-    if name in NOT_IN_LIBERTY:
-        in_liberty = False
+    name = rdoinfoutils.get_index(rdoinfo).get(cmdargs.name).name
+    sfdistgit = name + '-distgit'
 
-    print "In liberty ?: %s" % in_liberty
+    print "In liberty ?: %s" % (name not in NOT_IN_LIBERTY)
 
-    r = requests.get('http://%s/r/projects/?d' % config.rpmfactory)
-    projects = json.loads(r.text[4:])
+    projects = msfutils.inventory(config.rpmfactory).names()
 
     create = True
-    if set([name, sfdistgit]).issubset(set(projects)):
+    if set([name, sfdistgit]).issubset(projects):
         create = False
 
     if not cmdargs.force and not create:
         print "Project %s and %s already exists" % (name, sfdistgit)
-        return
+        return False
 
     if cmdargs.force and not create:
         print "Project %s already exists. But force !" % name
+    return True
 
-    print "Workdir is: %s" % workdir
+
+def project_import_step(cmdargs, workdir, rdoinfo, step):
+    """ Run an import step of a project
+
+    Return 'ok' when the next steps can run, 'stop' when the import
+    must stop there and 'clean' when the project must also be deleted.
+    """
+    name, distgit, upstream, \
+        sfdistgit, maints, conf, mdistgit = \
+        rdoinfoutils.get_index(rdoinfo).get(cmdargs.name)
+
+    sfgerrit = config.gerrit_rpmfactory % config.userlogin
+    in_liberty = name not in NOT_IN_LIBERTY
+
+    print "=== %s: %s step (workdir is %s) ===" % (name, step, workdir)
     msf = msfutils.ManageSfUtils('http://' + config.rpmfactory,
                                  'admin', config.adminpass)
 
-    try:
-        import_distgit(msf, sfgerrit,
-                       sfdistgit, distgit, mdistgit,
-                       conf, workdir, in_liberty=in_liberty)
-    except BranchNotFoundException, e:
-        msg = "(%s) Unable to find a specific branch to import" % name + \
-            " distgit: %s" % e
-        logging.warning(msg)
-        print msg
-        delete_project(name)
-        return False
-    try:
-        import_mirror(msf, sfgerrit, name, upstream, workdir,
-                      in_liberty=in_liberty)
-    except BranchNotFoundException, e:
-        msg = "(%s) Unable to find a specific branch to import" % name + \
-            " the mirror repo: %s" % e
-        logging.warning(msg)
-        print msg
-        delete_project(name)
-        return False
-
-    if in_liberty and not conf == 'rpmfactory-puppet':
+    if step == 'distgit':
         try:
-            set_patches_on_mirror(msf, sfgerrit, name, sfdistgit,
-                                  workdir)
-        except RequestedTagDoesNotExists, e:
-            print "Import warning: %s. liberty-patches not created" % e
-            return False
-        except PRequestedTagDoesNotExists, e:
-            print "Import error: %s. Clean project" % e
-            delete_project(name)
-            return False
-
-    return True
+            import_distgit(msf, sfgerrit,
+                           sfdistgit, distgit, mdistgit,
+                           conf, workdir, in_liberty=in_liberty)
+        except BranchNotFoundException, e:
+            msg = "(%s) Unable to find a specific branch to import" % name + \
+                " distgit: %s" % e
+            logging.warning(msg)
+            print msg
+            return 'clean'
+    elif step == 'mirror':
+        try:
+            import_mirror(msf, sfgerrit, name, upstream, workdir,
+                          in_liberty=in_liberty)
+        except BranchNotFoundException, e:
+            msg = "(%s) Unable to find a specific branch to import" % name + \
+                " the mirror repo: %s" % e
+            logging.warning(msg)
+            print msg
+            return 'clean'
+    elif step == 'patches':
+        if in_liberty and not conf == 'rpmfactory-puppet':
+            try:
+                set_patches_on_mirror(msf, sfgerrit, name, sfdistgit,
+                                      workdir)
+            except RequestedTagDoesNotExists, e:
+                print "Import warning: %s. liberty-patches not created" % e
+                return 'stop'
+            except PRequestedTagDoesNotExists, e:
+                print "Import error: %s. Clean project" % e
+                return 'clean'
+    elif step == 'maints':
+        if project_sync_maints(cmdargs, workdir, rdoinfo):
+            # Not journaled, retried by --resume
+            print "Import error: maintainers of %s not synced" % name
+            return 'stop'
+    return 'ok'
+
+
+def imported_projects(rdoinfo, cmdargs):
+    """ Return the imported projects of --type or the --name project """
+    if cmdargs.type:
+        projects = fetch_all_project_type(rdoinfo, cmdargs.type)
+        return get_project_status(projects, 2)
+    return [cmdargs.name]
+
+
+def project_import(cmdargs, workdir, rdoinfo, projects, jobs=1,
+                   jnl=None):
+    """ Import projects, return the list of the imported ones
+
+    The import steps of the projects run as a dependency graph over
+    jobs worker processes: the distgit and the mirror of a project are
+    imported concurrently, then the patches branch is created and the
+    maintainers are synced. Projects are deleted when a step asks for it
+    once all the steps are done. Steps done according to the journal are
+    skipped.
+    """
+    tasks = []
+    for project in projects:
+        for step in IMPORT_STEPS:
+            if jnl and jnl.is_done(project, step):
+                continue
+            deps = [(project, dep) for dep in IMPORT_STEPS[step]
+                    if not (jnl and jnl.is_done(project, dep))]
+            tasks.append(((project, step), project, deps, {'step': step}))
+    if jobs > 1:
+        # Workers inherit the parsed rdoinfo
+        rdoinfoutils.get_index(rdoinfo)
+    kargs = {'cmdargs': cmdargs, 'workdir': workdir, 'rdoinfo': rdoinfo}
+    imported = []
+    clean = []
+    failure = None
+    for (project, step), _, status, output, error in batch.run_graph(
+            project_import_step, tasks, kargs, jobs,
+            ok=lambda status: status == 'ok'):
+        if output:
+            sys.stdout.write(output)
+        if error == batch.SKIPPED:
+            continue
+        if error:
+            # As the sequential import, stop at unexpected errors
+            failure = "%s import failed at the %s step: %s" % (
+                project, step, error)
+            break
+        if status == 'clean' and project not in clean:
+            clean.append(project)
+        if status == 'ok' and jnl:
+            jnl.done(project, step)
+        if step == 'maints':
+            imported.append(project)
+    for project in clean:
+        delete_project(project)
+        if jnl:
+            jnl.reset(project)
+    if failure:
+        print failure
+        sys.exit(1)
+    return imported
 
 
 def project_create(cmdargs, workdir, rdoinfo):
     raise NotImplemented
 
 
-def replicate_project(cmdargs, workdir, rdoinfo):
+def replicate_project(cmdargs, workdir, rdoinfo, msf=None, trigger=True):
     print "Setup replication for RDO project %s" % cmdargs.name
     (name, distgit, upstream, sfdistgit, maints,
      conf, mdistgit) = rdoinfoutils.fetch_project_infos(
         rdoinfo, cmdargs.name)
 
-    msf = msfutils.ManageSfUtils('http://' + config.rpmfactory,
-                                 'admin', config.adminpass)
+    if msf is None:
+        msf = msfutils.ManageSfUtils('http://' + config.rpmfactory,
+                                     'admin', config.adminpass)
+    # Existence checks use per run listings of the Github organizations
+    gh = ghclient.client(cmdargs.token)
 
     for repo in (sfdistgit, name):
         skip_github_creation = False
         if repo.endswith('-distgit'):
             print "Setup replication for (distgit) %s" % repo
-            resp = requests.get("https://github.com/rdo-packages/%s" % repo)
-            if resp.ok:
+            if gh.repo_exists('rdo-packages', repo):
                 print "%s already created on rdo-packages. " \
                       "Skip repo creation." % repo
                 skip_github_creation = True
@@ -604,7 +737,8 @@ def replicate_project(cmdargs, workdir, rdoinfo):
                 msf.replicateProjectGithub(
                     repo, None, cmdargs.token,
                     org="rdo-packages",
-                    skip_github_creation=skip_github_creation)
+                    skip_github_creation=skip_github_creation,
+                    trigger=trigger)
             else:
                 print "Full skip !"
         else:
@@ -615,13 +749,11 @@ def replicate_project(cmdargs, workdir, rdoinfo):
                                 'http://')
             fork = fork.replace('.git', '')
             print "Check %s exists on github" % fork
-            resp = requests.get(fork)
-            if not resp.ok:
+            if not gh.repo_url_exists(fork):
                 print "Unable to find forked source %s" % fork
                 sys.exit(1)
             print "Github repo creation is forked from %s" % fork
-            resp = requests.get("https://github.com/rdo-packages/%s" % repo)
-            if resp.ok:
+            if gh.repo_exists('rdo-packages', repo):
                 print "%s already created on rdo-packages. " \
                       "Skip repo creation." % repo
                 skip_github_creation = True
@@ -630,7 +762,7 @@ def replicate_project(cmdargs, workdir, rdoinfo):
                     repo, fork, cmdargs.token,
                     org="rdo-packages",
                     skip_github_creation=skip_github_creation,
-                    need_fork=True)
+                    need_fork=True, trigger=trigger)
             else:
                 print "Full skip !"
 
@@ -647,7 +779,11 @@ def add_to_project_groups(name, maintainer):
                                "ptl-group core-group")
 
 
-def project_sync_maints(cmdargs, workdir, rdoinfo):
+def project_sync_maints(cmdargs, workdir, rdoinfo, project_details=None):
+    """ Sync the PTL and CORE groups of a project with its maintainers
+
+    Return the list of the membership changes that failed.
+    """
     print "\n=== Sync maintainer in project " + \
           "%s groups + service user ===" % cmdargs.name
     (name, distgit, upstream, sfdistgit, maints,
@@ -656,43 +792,81 @@ def project_sync_maints(cmdargs, workdir, rdoinfo):
     msf = msfutils.ManageSfUtils('http://' + config.rpmfactory,
                                  'admin', config.adminpass)
 
-    infos = msf.listAllProjectDetails()
-    memberships = fetch_project_members(infos, name)
-
-    # Clean actual members
-    print "\nAttempt to clean existing members in %s" % name
-    for project_mbs in memberships:
-        for mb in memberships[project_mbs][0]:  # ptl
-            if mb == 'admin@rpmfactory.beta.rdoproject.org':
-                continue
-            msf.deleteUserFromProjectGroup(project_mbs, mb, 'ptl-group')
-        for mb in memberships[project_mbs][1]:  # core
-            if mb == 'admin@rpmfactory.beta.rdoproject.org':
-                continue
-            msf.deleteUserFromProjectGroup(project_mbs, mb, 'core-group')
-
-    for maintainer in maints:
-        print "\nAttempt to add maintainer %s" % maintainer
+    # Loaded once by batch runs, queried for this project otherwise
+    if project_details is None:
+        project_details = get_project_details(msf, name)
+    memberships = fetch_project_members(project_details, name)
+
+    # maintainers and the service user must be in the PTL and CORE groups
+    desired = set(maints) | set([config.service_user_mail])
+    ops = maints_sync_plan(memberships, desired)
+    if not ops:
+        print "Groups already in sync"
+        return []
+    for op, project, mb, groups in ops:
+        print "[PLAN] %s %s %s %s" % (op, mb, project, " ".join(groups))
+    if getattr(cmdargs, 'dry_run', False):
+        return []
+
+    def apply_op(op):
+        op, project, mb, groups = op
         try:
-            add_to_project_groups(name, maintainer)
+            if op == 'add':
+                msf.addUsertoProjectGroups(project, mb, " ".join(groups))
+            else:
+                msf.deleteUserFromProjectGroup(project, mb, groups[0])
         except msfutils.SFManagerException, e:
-            print "Failed to add user in groups : %s" % e
+            return "Failed to %s %s in %s groups : %s" % (op, mb, project, e)
 
-    # Add a service user to the project group
-    print
-    add_to_project_groups(name, config.service_user_mail)
+    jobs = max(1, min(getattr(cmdargs, 'jobs', 1), len(ops)))
+    pool = ThreadPool(jobs)
+    errors = []
+    try:
+        for error in pool.imap(apply_op, ops):
+            if error:
+                print error
+                errors.append(error)
+    finally:
+        pool.close()
+        pool.join()
+    return errors
+
+
+def sync_maints(kargs, projects, jnl):
+    """ Sync the maintainers of projects, journaling those fully synced.
+    Return the projects for which a membership change failed.
+    """
+    failed = []
+    for project in projects:
+        kargs['cmdargs'].name = project
+        if project_sync_maints(**kargs):
+            failed.append(project)
+        elif not kargs['cmdargs'].dry_run:
+            jnl.done(project)
+    return failed
 
 
-def get_project_status(projects, typ):
-    r = requests.get('http://%s/r/projects/?d' % config.rpmfactory)
-    sfprojects = json.loads(r.text[4:])
-    sfprojects = [os.path.basename(p) for p in sfprojects]
+def maints_sync_plan(memberships, desired):
+    """ Return the (op, project, member, groups) operations to apply so
+    that the PTL and CORE groups of projects in memberships are desired
+    """
+    ops = []
+    for project in sorted(memberships):
+        adds = {}
+        for idx, group in ((0, 'ptl-group'), (1, 'core-group')):
+            current = set(memberships[project][idx])
+            current.discard(SF_ADMIN_MAIL)
+            for mb in sorted(current - desired):
+                ops.append(('remove', project, mb, [group]))
+            for mb in desired - current:
+                adds.setdefault(mb, []).append(group)
+        for mb in sorted(adds):
+            ops.append(('add', project, mb, adds[mb]))
+    return ops
 
-    status = {}
-    for project in projects:
-        status[project] = check_project_status(sfprojects, project)
 
-    return [p for p, s in status.items() if s == typ]
+def get_project_status(projects, typ):
+    return msfutils.inventory(config.rpmfactory).classify(projects)[typ]
 
 
 def projects_status(cmdargs, workdir, rdoinfo):
@@ -702,12 +876,13 @@ def projects_status(cmdargs, workdir, rdoinfo):
 
     print
 
-    imported = get_project_status(projects, 2)
+    status = msfutils.inventory(config.rpmfactory).classify(projects)
+    imported = status[2]
     print "Imported: %s : %s" % (len(imported), ", ".join(imported))
-    inconsistent = get_project_status(projects, 1)
+    inconsistent = status[1]
     print "Inconsistent: %s : %s" % (
         len(inconsistent), ", ".join(inconsistent))
-    notimported = get_project_status(projects, 0)
+    notimported = status[0]
     print "Not imported: %s : %s" % (
         len(notimported), ", ".join(notimported))
 
@@ -733,14 +908,9 @@ def update_config_for_project(cmdargs, workdir, rdoinfo):
                            }
 
     pdir = os.path.join(workdir, 'config')
-    # Clean previous if exist
-    if os.path.isdir(pdir):
-        shutil.rmtree(pdir)
-    with cdir(workdir):
-        git('clone', 'http://%s/r/%s' % (config.rpmfactory, 'config'),
-            'config')
-    with cdir(pdir):
-        git('remote', 'add', 'gerrit', sfgerrit + 'config')
+    with gitcache.checkout('http://%s/r/%s' % (config.rpmfactory, 'config'),
+                           pdir, branch='master'):
+        gitcache.set_remote('gerrit', sfgerrit + 'config')
         zuul_projects = yaml.load(
             file("zuul/projects.yaml").read())
 
@@ -770,7 +940,7 @@ def update_config_for_project(cmdargs, workdir, rdoinfo):
                 '%s <%s>' % (config.username, config.useremail),
                 '-m', cmtmsg)
             git('review', '-i', '-r', 'gerrit', 'master')
-            sha = open(".git/refs/heads/master").read()
+            sha = git('rev-parse', 'HEAD')
             gu = msfutils.GerritSfUtils(config.rpmfactory,
                                         config.userlogin)
             try:
@@ -779,6 +949,50 @@ def update_config_for_project(cmdargs, workdir, rdoinfo):
                 print "Config change for has not be merged (%s)" % e
 
 
+def build_branch_plan(rtype, conf, upstream, distgit, mdistgit, in_liberty):
+    """ Return the gitsync.BranchPlan of a mirror or distgit project
+
+    Sources of a local branch are added by increasing precedence.
+    """
+    plan = gitsync.BranchPlan()
+    if rtype == 'mirror':
+        plan.add(upstream, 'master', 'master')
+        plan.add(upstream, 'stable/liberty', 'stable/liberty')
+        plan.add(upstream, 'stable/mitaka', 'stable/mitaka')
+    elif rtype == 'distgit':
+        if conf == 'core':
+            plan.add(distgit, 'liberty-rdo', 'rdo-liberty')
+            plan.add(distgit, 'liberty-rdo', 'liberty-rdo')
+            plan.add(distgit, 'mitaka-rdo', 'rdo-mitaka')
+            plan.add(distgit, 'mitaka-rdo', 'mitaka-rdo')
+        elif conf == 'client' or conf == 'lib' or conf == 'None':
+            # /!\ Some projects still have a rdo-liberty branch on the
+            # master branch from Fedora VCS.
+            # So try to sync from there first.
+            # Then check if rdo-liberty branch is found on github (mdistgit)
+            # then try to sync from github. /!\
+            if distgit.find('pkgs.fedoraproject.org') >= 0:
+                if in_liberty:
+                    # Check this above prevents when we request a missing repo
+                    # that not exists on pkgs.fedoraproject.org
+                    plan.add(distgit, 'liberty-rdo', 'master')
+                    plan.add(distgit, 'mitaka-rdo', 'master')
+            # The NOT_IN_LIBERTY list is not fully accurate and sometime
+            # a rdo-liberty branch exists on Github so fetch it if exists.
+            plan.add(mdistgit, 'liberty-rdo', 'rdo-liberty')
+            plan.add(mdistgit, 'liberty-rdo', 'liberty-rdo')
+            plan.add(mdistgit, 'mitaka-rdo', 'rdo-mitaka')
+            plan.add(mdistgit, 'mitaka-rdo', 'mitaka-rdo')
+
+        plan.add(mdistgit, 'kilo-rdo', 'rdo-kilo')
+        plan.add(mdistgit, 'kilo-rdo', 'kilo-rdo')
+        plan.add(mdistgit, 'rpm-master', 'rpm-master')
+        plan.add(mdistgit, 'rpm-liberty', 'rpm-liberty')
+        plan.add(mdistgit, 'rpm-mitaka', 'rpm-mitaka')
+        plan.add(mdistgit, 'rpm-kilo', 'rpm-kilo')
+    return plan
+
+
 def refresh_repo_for_project(cmdargs, workdir, rdoinfo, rtype):
     (name, distgit, upstream, sfdistgit, maints,
      conf, mdistgit) = rdoinfoutils.fetch_project_infos(
@@ -808,51 +1022,18 @@ def refresh_repo_for_project(cmdargs, workdir, rdoinfo, rtype):
         else:
             local = sfgerrit + 'openstack/' + name
         push_tags = True
-        branches = ((upstream, 'master', 'master'),
-                    (upstream, 'stable/liberty', 'stable/liberty'),
-                    (upstream, 'stable/mitaka', 'stable/mitaka'))
     elif rtype == 'distgit':
         local = sfgerrit + 'openstack/' + name
-        if conf == 'core':
-            branches = [
-                (distgit, 'liberty-rdo', 'rdo-liberty'),
-                (distgit, 'liberty-rdo', 'liberty-rdo'),
-                (distgit, 'mitaka-rdo', 'rdo-mitaka'),
-                (distgit, 'mitaka-rdo', 'mitaka-rdo'),
-            ]
-        elif conf == 'client' or conf == 'lib' or conf == 'None':
-            branches = []
-            # /!\ Some projects still have a rdo-liberty branch on the
-            # master branch from Fedora VCS.
-            # So try to sync from there first.
-            # Then check if rdo-liberty branch is found on github (mdistgit)
-            # then try to sync from github. /!\
-            if distgit.find('pkgs.fedoraproject.org') >= 0:
-                if in_liberty:
-                    # Check this above prevents when we request a missing repo
-                    # that not exists on pkgs.fedoraproject.org
-                    branches.extend(((distgit, 'liberty-rdo', 'master'),))
-                    branches.extend(((distgit, 'mitaka-rdo', 'master'),))
-            # The NOT_IN_LIBERTY list is not fully accurate and sometime
-            # a rdo-liberty branch exists on Github so fetch it if exists.
-            branches.extend(((mdistgit, 'liberty-rdo', 'rdo-liberty'),))
-            branches.extend(((mdistgit, 'liberty-rdo', 'liberty-rdo'),))
-            branches.extend(((mdistgit, 'mitaka-rdo', 'rdo-mitaka'),))
-            branches.extend(((mdistgit, 'mitaka-rdo', 'mitaka-rdo'),))
-
-        branches.extend(((mdistgit, 'kilo-rdo', 'rdo-kilo'),
-                         (mdistgit, 'kilo-rdo', 'kilo-rdo'),
-                         (mdistgit, 'rpm-master', 'rpm-master'),
-                         (mdistgit, 'rpm-liberty', 'rpm-liberty'),
-                         (mdistgit, 'rpm-mitaka', 'rpm-mitaka'),
-                         (mdistgit, 'rpm-kilo', 'rpm-kilo'),))
 
+    plan = build_branch_plan(rtype, conf, upstream, distgit, mdistgit,
+                             in_liberty)
+    statuses = check_upstreams_and_sync(local, plan,
+                                        dry_run=cmdargs.show_plan)
+    if push_tags:
+        statuses[(upstream, 'tags', '*')] = check_tags_and_sync(
+            local, upstream, dry_run=cmdargs.show_plan)
     ret = {}
-    for branch in branches:
-        status = check_upstream_and_sync(name, workdir, local,
-                                         branch[1], branch[0],
-                                         rbranch=branch[2],
-                                         push_tags=push_tags)
+    for branch, status in statuses.items():
         if branch[0].find('pkgs.fedoraproject.org') >= 0:
             # Just for clarify the summary
             branch_name = "%s (legacy)(<-%s)" % (branch[1], branch[2])
@@ -871,18 +1052,10 @@ def delete_project(p):
     msf.deleteProject(p + '-distgit')
 
 
-def check_project_status(sfprojects, name):
-
-    sfdistgit = name + '-distgit'
-
-    status = 2  # imported
-    if not set([name, sfdistgit]).issubset(set(sfprojects)):
-        status = 1  # inconsistent
-
-    if name not in sfprojects and sfdistgit not in sfprojects:
-        status = 0  # not imported
-
-    return status
+def get_project_details(msf, name):
+    """ Return the details of the mirror and distgit projects of name """
+    return dict((p, msf.getProjectDetails(p))
+                for p in (name, name + '-distgit'))
 
 
 def fetch_project_members(infos, name):
@@ -900,7 +1073,7 @@ def project_members(cmdargs, workdir, rdoinfo):
     msf = msfutils.ManageSfUtils('http://' + config.rpmfactory,
                                  'admin', config.adminpass)
     name = cmdargs.name
-    infos = msf.listAllProjectDetails()
+    infos = get_project_details(msf, name)
     ret = fetch_project_members(infos, name)
     print ret
 
@@ -990,42 +1163,44 @@ def update_mirror_acls(cmdargs, workdir, rdoinfo):
     """
     assert workdir is not None
     name = rdoinfoutils.fetch_project_infos(rdoinfo, cmdargs.name)[0]
-    with cdir(workdir):
-        git('init', name)
-    with cdir(os.path.join(workdir, name)):
-        git('remote', 'add', 'gerrit', 'ssh://%s@%s:29418/%s' %
-            (config.service_user_name, config.rpmfactory, name))
-        git('fetch', 'gerrit', 'refs/meta/config:meta/config')
-        git('checkout', 'meta/config')
-        git('config', '-f', 'project.config', '--unset-all',
-            'access.refs/heads/*.label-Verified')
-        git('config', '-f', 'project.config', '--add',
-            'access.refs/heads/*.label-Verified',
-            '-2..+0 group %s-ptl' % name)
-        git('config', '-f', 'project.config', '--unset-all',
-            'access.refs/heads/*.label-Workflow')
-        git('config', '-f', 'project.config', '--add',
-            'access.refs/heads/*.label-Workflow',
-            '-1..+0 group %s-ptl' % name)
-        git('config', '-f', 'project.config', '--add',
-            'access.refs/heads/*.label-Workflow',
-            '-1..+0 group %s-core' % name)
-        git('config', '-f', 'project.config', '--add',
-            'access.refs/heads/*.label-Workflow',
-            '-1..+0 group Registered Users')
-        if 'project.config' in git('ls-files',
-                                   '-o',
-                                   '-m',
-                                   '--exclude-standard').split('\n'):
-            git('add', 'project.config')
-            with setenv(GIT_COMMITTER_NAME='Bender RPM Factory',
-                        GIT_AUTHOR_NAME='Bender RPM Factory',
-                        GIT_AUTHOR_EMAIL=config.service_user_mail,
-                        GIT_COMMITTER_EMAIL=config.service_user_mail):
-                git('commit', '-m', 'Set ACLs readonly')
-            git('push', 'gerrit', 'meta/config:meta/config')
-        else:
-            print "Skipped as already setup"
+    pdir = os.path.join(workdir, name)
+    with gitcache.lock(pdir):
+        git('init', pdir)
+        with cdir(pdir):
+            gitcache.set_remote('gerrit', 'ssh://%s@%s:29418/%s' %
+                                (config.service_user_name, config.rpmfactory,
+                                 name))
+            git('fetch', 'gerrit', 'refs/meta/config')
+            git('checkout', '-f', '-B', 'meta/config', 'FETCH_HEAD')
+            git('config', '-f', 'project.config', '--unset-all',
+                'access.refs/heads/*.label-Verified')
+            git('config', '-f', 'project.config', '--add',
+                'access.refs/heads/*.label-Verified',
+                '-2..+0 group %s-ptl' % name)
+            git('config', '-f', 'project.config', '--unset-all',
+                'access.refs/heads/*.label-Workflow')
+            git('config', '-f', 'project.config', '--add',
+                'access.refs/heads/*.label-Workflow',
+                '-1..+0 group %s-ptl' % name)
+            git('config', '-f', 'project.config', '--add',
+                'access.refs/heads/*.label-Workflow',
+                '-1..+0 group %s-core' % name)
+            git('config', '-f', 'project.config', '--add',
+                'access.refs/heads/*.label-Workflow',
+                '-1..+0 group Registered Users')
+            if 'project.config' in git('ls-files',
+                                       '-o',
+                                       '-m',
+                                       '--exclude-standard').split('\n'):
+                git('add', 'project.config')
+                with setenv(GIT_COMMITTER_NAME='Bender RPM Factory',
+                            GIT_AUTHOR_NAME='Bender RPM Factory',
+                            GIT_AUTHOR_EMAIL=config.service_user_mail,
+                            GIT_COMMITTER_EMAIL=config.service_user_mail):
+                    git('commit', '-m', 'Set ACLs readonly')
+                git('push', 'gerrit', 'meta/config:meta/config')
+            else:
+                print "Skipped as already setup"
 
 
 def update_groups_inc_proven(cmdargs, workdir, rdoinfo):
@@ -1048,8 +1223,32 @@ def update_groups_inc_proven(cmdargs, workdir, rdoinfo):
 
 
 def main():
+    start = time.time()
+    try:
+        run(start)
+    finally:
+        # Here as the pool workers of --jobs exit without atexit handlers
+        if config.mirror_cache:
+            gitcache.prune(since=start)
+        gitsync.prune(since=start)
+
+
+def run(start):
     parser = argparse.ArgumentParser(prog='sfrdo')
     parser.add_argument('--workdir', type=str, help='helper option')
+    parser.add_argument('--state-dir', type=str, default=None,
+                        help='Keep checkouts in this directory between runs '
+                             'and refresh them instead of cloning again')
+    parser.add_argument('--resume', action='store_true', default=False,
+                        help='Resume the last run of the same command, '
+                             'skipping the projects it completed')
+    parser.add_argument('--refresh-rdoinfo', action='store_true',
+                        default=False,
+                        help='Ignore the rdoinfo cache and fetch rdoinfo')
+    parser.add_argument('--no-mirror-cache', action='store_true',
+                        default=False,
+                        help='Clone and fetch from remotes directly instead '
+                             'of using the local mirror cache')
 
     subparsers = parser.add_subparsers(
         title='commands',
@@ -1073,6 +1272,9 @@ def main():
     parser_import.add_argument(
         '--serviceuser', action='store_true', default=None,
         help='Use service identity to sync (set in config.py)')
+    parser_import.add_argument(
+        '--jobs', type=int, default=1,
+        help='Number of import steps to run concurrently')
     parser_import.add_argument('--rdoinfo_fork',
                                action='store_true', default=False,
                                help='Use current rdoinfo fork')
@@ -1091,6 +1293,12 @@ def main():
     parser_sync_maintainer.add_argument(
         '--type', type=str, default=None,
         help='Limit to imported projects of type (core, client, lib)')
+    parser_sync_maintainer.add_argument(
+        '--dry-run', action='store_true', default=False,
+        help='Display the membership changes, do not apply them')
+    parser_sync_maintainer.add_argument(
+        '--jobs', type=int, default=4,
+        help='Number of membership changes to apply concurrently')
     parser_sync_maintainer.add_argument(
         '--github-usernames', type=str, default=None,
         help=('a file with a list of the github usernames of maintainers '
@@ -1117,6 +1325,12 @@ def main():
         '--puppet', action='store_true', default=None,
         help='Sync puppet mirror repo from upstream '
              '[use rdoinfo fork]')
+    parser_sync_repo.add_argument(
+        '--jobs', type=int, default=1,
+        help='Number of projects to sync concurrently')
+    parser_sync_repo.add_argument(
+        '--show-plan', action='store_true', default=False,
+        help='Display the source chosen for each branch, do not sync')
 
     parser_sync_gp_distgit = subparsers.add_parser(
         'sync_gp_distgit',
@@ -1196,10 +1410,16 @@ def main():
         '--dry-run', action='store_true', default=False,
         help='Run the process but do not create the branches')
 
-    subparsers.add_parser(
+    parser_ghuser = subparsers.add_parser(
         'ghuser',
         help='Find username based on Github '
              '[migration helper]')
+    parser_ghuser.add_argument(
+        '--token', type=str, default=None,
+        help='Github authentication token (higher rate limits)')
+    parser_ghuser.add_argument(
+        '--jobs', type=int, default=4,
+        help='Number of concurrent Github lookups')
 
     parser_project_members = subparsers.add_parser(
         'project_members',
@@ -1261,94 +1481,167 @@ def main():
         '--file', type=str, help='List of project names')
 
     args = parser.parse_args()
-    rdoinfo = rdoinfoutils.fetch_rdoinfo()
-    if not args.workdir:
+    if args.no_mirror_cache:
+        config.mirror_cache = False
+    sshmux.enable()
+    # rdoinfo is only fetched by commands that read it
+    rdoinfo = rdoinfoutils.LazyRdoInfo(refresh=args.refresh_rdoinfo)
+    if args.state_dir:
+        workdir = os.path.join(os.path.abspath(args.state_dir), 'workdir')
+        if not os.path.isdir(workdir):
+            os.makedirs(workdir)
+    elif not args.workdir:
         workdir = tempfile.mkdtemp()
     else:
         workdir = args.workdir
     kargs = {'cmdargs': args,
              'workdir': workdir,
              'rdoinfo': rdoinfo}
+    # The journal of a run is keyed by the command and its selection
+    run_key = " ".join([args.command] + [
+        "--%s=%s" % (opt, getattr(args, opt)) for opt in (
+            'type', 'name', 'distgit', 'puppet', 'from_p', 'rdoinfo_fork')
+        if getattr(args, opt, None)])
+    jnl = journal.Journal(
+        os.path.join(args.state_dir or config.userdir, 'journal.jsonl'),
+        run_key, resume=args.resume)
+    logging.debug("%s: startup took %.3fs" % (args.command,
+                                              time.time() - start))
 
     if args.command == 'import':
         if args.rdoinfo_fork:
             # Use our rdoinfo fork where puppet repo are described
             rdoinfo_fork = 'http://rpmfactory.beta.rdoproject.org/r/rdoinfo'
-            rdoinfo = rdoinfoutils.fetch_rdoinfo(repo=rdoinfo_fork)
+            rdoinfo = rdoinfoutils.LazyRdoInfo(
+                repo=rdoinfo_fork, refresh=args.refresh_rdoinfo)
             kargs['rdoinfo'] = rdoinfo
-        if args.type:
-            projects = fetch_all_project_type(rdoinfo, args.type)
-            if args.from_p:
-                projects = projects[projects.index(args.from_p):]
-        else:
-            projects = [args.name]
+
+        def import_projects():
+            if args.type:
+                projects = fetch_all_project_type(rdoinfo, args.type)
+                if args.from_p:
+                    projects = projects[projects.index(args.from_p):]
+            else:
+                projects = [args.name]
+            return projects
+        projects = jnl.projects(import_projects)
         print "Import projects : %s" % ", ".join(projects)
+        to_import = []
         for project in projects:
             if project in BL:
                 print "Skip %s as BL" % project
                 continue
+            if any(jnl.is_done(project, step) for step in IMPORT_STEPS):
+                # Checked by the resumed run
+                to_import.append(project)
+                continue
             kargs['cmdargs'].name = project
             rdoinfoutils.display_details(**kargs)
-            status = project_import(**kargs)
-            if status:
-                project_sync_maints(**kargs)
-                update_config_for_project(**kargs)
+            if project_import_check(**kargs):
+                to_import.append(project)
+        project_import(projects=to_import, jobs=args.jobs, jnl=jnl,
+                       **kargs)
+        imported = [p for p in to_import if jnl.is_done(p, 'maints')]
+        if imported and not jnl.is_done('(all)', 'config'):
+            # One config change for all the imported projects
+            kargs['cmdargs'].name = imported
+            update_config_for_project(**kargs)
+            jnl.done('(all)', 'config')
     elif args.command == 'create':
         project_create(**kargs)
     elif args.command == 'sync_maints':
-        if args.type:
-            projects = fetch_all_project_type(rdoinfo, args.type)
-            projects = get_project_status(projects, 2)
-        else:
-            projects = [args.name]
+        projects = jnl.pending(jnl.projects(
+            lambda: imported_projects(rdoinfo, args)))
         print "Sync maints on projects : %s" % ", ".join(projects)
-        for project in projects:
-            kargs['cmdargs'].name = project
-            project_sync_maints(**kargs)
+        if len(projects) > 1:
+            msf = msfutils.ManageSfUtils('http://' + config.rpmfactory,
+                                         'admin', config.adminpass)
+            kargs['project_details'] = msf.listAllProjectDetails(
+                projects + [p + '-distgit' for p in projects])
+        failed = sync_maints(kargs, projects, jnl)
+        if failed:
+            print "Membership changes failed for: %s" % ", ".join(failed)
+            sys.exit(1)
     elif args.command == 'replicate':
         if not args.token:
             print "Please provide github token"
             sys.exit(1)
-        if args.type:
-            projects = fetch_all_project_type(rdoinfo, args.type)
-            projects = get_project_status(projects, 2)
-        else:
-            projects = [args.name]
+        projects = jnl.pending(jnl.projects(
+            lambda: imported_projects(rdoinfo, args)))
         print "Setup github replication for projects : %s" % \
             ", ".join(projects)
-        for project in projects:
-            kargs['cmdargs'].name = project
-            replicate_project(**kargs)
+        kargs['msf'] = msfutils.ManageSfUtils(
+            'http://' + config.rpmfactory, 'admin', config.adminpass)
+        if len(projects) > 1:
+            # Mirror and distgit keys of all projects, made in parallel
+            kargs['msf'].prepare_keys(2 * len(projects))
+        # Configure all the repos then replicate them at once, Gerrit
+        # loads the replication config once
+        kargs['trigger'] = False
+        configured = []
+        try:
+            for project in projects:
+                kargs['cmdargs'].name = project
+                start = time.time()
+                replicate_project(**kargs)
+                print "%s replication configured in %.1fs" % (
+                    project, time.time() - start)
+                configured.append(project)
+        finally:
+            # Even when a project fails (or exits), replicate those
+            # already configured
+            gh = ghclient.client(args.token)
+            print "%s Github existence checks answered with %s API " \
+                  "requests in %.1fs" % (gh.stats['exists'],
+                                         gh.stats['requests'],
+                                         gh.stats['exists_time'])
+            if kargs['msf'].pending:
+                start = time.time()
+                count = len(kargs['msf'].pending)
+                kargs['msf'].triggerReplication(config.userlogin)
+                print "Replication of %s repos started in %.1fs" % (
+                    count, time.time() - start)
+            # Replicated once triggered
+            for project in configured:
+                jnl.done(project)
     elif args.command == 'status':
         if not args.type:
             print "Provide the --type options"
             sys.exit(1)
         projects_status(**kargs)
     elif args.command == 'ghuser':
-        import time
         projects = fetch_all_project_type(rdoinfo, 'core')
         projects.extend(fetch_all_project_type(rdoinfo, 'client'))
         projects.extend(fetch_all_project_type(rdoinfo, 'lib'))
         projects.extend(fetch_all_project_type(rdoinfo, 'None'))
         maints = {}
         for p in projects:
-            maintainers = rdoinfoutils.fetch_project_infos(rdoinfo, p)[4]
+            maintainers = rdoinfoutils.get_index(rdoinfo).get(p).maints
             for m in maintainers:
                 maints[m] = None
-        print maints
-        return
-        for m in maints.keys():
-            time.sleep(15)
-            print "\n---> Looking for %s" % m
+        gh = ghclient.client(args.token)
+        gh.jobs = args.jobs
+
+        def lookup(m):
             try:
-                user_info = msfutils.get_github_user_by_mail(m)
+                return m, msfutils.get_github_user_by_mail(
+                    m, args.token), None
+            except Exception as e:
+                return m, None, e
+
+        start = time.time()
+        for m, user_info, e in gh.map(lookup, sorted(maints)):
+            print "\n---> Looking for %s" % m
+            if e is None:
                 print "Found user %s detail (username, ...)" % user_info
                 maints[m] = user_info
-            except Exception as e:
+            else:
                 msg = "Could not find user."
-                print "%s (Reason: %s)" % (msg, e.message)
+                print "%s (Reason: %s)" % (msg, e)
 
         print maints
+        logging.debug("ghuser: %s lookups in %.1fs %s" % (
+            len(maints), time.time() - start, gh.stats))
     elif args.command == 'project_members':
         project_members(**kargs)
     elif args.command == 'infos':
@@ -1364,30 +1657,39 @@ def main():
         update_config_for_project(**kargs)
     elif args.command == 'sync_repo':
         # This command can be used in a Jenkins job so use WORKSPACE if exists.
-        kargs['workdir'] = os.environ.get('WORKSPACE', kargs['workdir'])
+        if not args.state_dir:
+            kargs['workdir'] = os.environ.get('WORKSPACE', kargs['workdir'])
         kargs['rtype'] = 'mirror'
         if args.distgit:
             kargs['rtype'] = 'distgit'
         if kargs['rtype'] == 'mirror' and args.puppet:
             # Use our rdoinfo fork where puppet repo are described
             rdoinfo_fork = 'http://review.rdoproject.org/r/rdoinfo'
-            rdoinfo = rdoinfoutils.fetch_rdoinfo(repo=rdoinfo_fork)
+            rdoinfo = rdoinfoutils.LazyRdoInfo(
+                repo=rdoinfo_fork, refresh=args.refresh_rdoinfo)
             kargs['rdoinfo'] = rdoinfo
         final_status = {}
-        if args.type:
-            projects = fetch_all_project_type(rdoinfo, args.type)
-            projects = get_project_status(projects, 2)
-        else:
-            projects = [args.name]
+        projects = jnl.pending(jnl.projects(
+            lambda: imported_projects(rdoinfo, args)))
         print "Refresh %s branches for projects : %s" % (
             kargs['rtype'], ", ".join(projects))
-        for project in projects:
-            kargs['cmdargs'].name = project
-            ret = refresh_repo_for_project(**kargs)
-            status_name = kargs['cmdargs'].name
+        if args.jobs > 1:
+            # Workers inherit the parsed rdoinfo
+            rdoinfoutils.get_index(rdoinfo)
+        for project, ret, output, error in batch.run(
+                refresh_repo_for_project, projects, kargs, args.jobs):
+            if output:
+                sys.stdout.write(output)
+            if error:
+                ret = {'(all)': [1, "[FAILED] %s" % error]}
+            status_name = project
             if args.distgit:
                 status_name += '-distgit'
             final_status[status_name] = ret
+            if not args.show_plan and \
+                    not any(status[0] for status in ret.values()):
+                # Failed projects are retried by --resume
+                jnl.done(project)
             sys.stdout.flush()
         print "\n=== Sync summary ==="
         cmd_ret = 0
@@ -1409,26 +1711,22 @@ def main():
             kargs['cmdargs'].name = project
             project_sync_gp_distgit(**kargs)
     elif args.command == "update_acls_mirror":
-        if args.type:
-            projects = fetch_all_project_type(rdoinfo, args.type)
-            projects = get_project_status(projects, 2)
-        else:
-            projects = [args.name]
+        projects = jnl.pending(jnl.projects(
+            lambda: imported_projects(rdoinfo, args)))
         print "Update ACLs for mirror projects: %s" % ", ".join(projects)
         for project in projects:
             kargs['cmdargs'].name = project
             update_mirror_acls(**kargs)
+            jnl.done(project)
     elif args.command == "set_rdo_proven_packagers":
-        if args.type:
-            projects = fetch_all_project_type(rdoinfo, args.type)
-            projects = get_project_status(projects, 2)
-        else:
-            projects = [args.name]
+        projects = jnl.pending(jnl.projects(
+            lambda: imported_projects(rdoinfo, args)))
         print "Update groups to include rdoprovenpackages: %s" % (
               ", ".join(projects))
         for project in projects:
             kargs['cmdargs'].name = project
             update_groups_inc_proven(**kargs)
+            jnl.done(project)
     elif args.command == "delete_projects":
         msf = msfutils.ManageSfUtils('http://' + config.rpmfactory,
                                      'admin', config.adminpass)
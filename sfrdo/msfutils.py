@@ -15,19 +15,32 @@
 # under the License.
 
 import os
+import re
 import sys
 import json
+import base64
 import tempfile
 import time
 import shlex
+import urllib
+import urlparse
+import threading
 import subprocess
+import multiprocessing
 
+from Queue import Queue, Empty
+
+from Crypto import Random
 from Crypto.PublicKey import RSA
 import requests
 
 from pysflib.sfauth import get_cookie
 from pysflib.sfgerrit import GerritUtils
 
+from sfrdo import config
+from sfrdo import ghclient
+from sfrdo import sshmux
+
 from requests.exceptions import HTTPError
 
 
@@ -39,6 +52,269 @@ class UnableToMergeException(Exception):
     pass
 
 
+class SfSession(object):
+    """ Authenticated HTTP session on a Software Factory
+
+    The auth_pubtkt cookie is fetched once and kept until it expires,
+    a request getting a 401 is retried once with a new cookie.
+    """
+    # Renew the cookie a bit before the expiry of the ticket
+    expiry_margin = 60
+
+    def __init__(self, host, user, passwd):
+        self.host = host
+        self.user = user
+        self.passwd = passwd
+        self.http = http()
+        self._cookie = None
+        self._validuntil = 0
+        self._gerrit = None
+
+    def cookie(self, renew=False):
+        if renew or self._cookie is None or \
+                time.time() > self._validuntil - self.expiry_margin:
+            self._cookie = get_cookie(self.host, self.user, self.passwd)
+            self._validuntil = time.time() + 3600
+            self._gerrit = None
+            fields = urllib.unquote(self._cookie).split(';')
+            for field in fields:
+                if field.startswith('validuntil='):
+                    self._validuntil = float(field.split('=', 1)[1])
+        return self._cookie
+
+    def request(self, method, url, **kwargs):
+        """ requests.request on url, relative to the host if no scheme """
+        if '://' not in url:
+            url = 'http://%s/%s' % (self.host, url.lstrip('/'))
+        resp = self.http.request(method, url,
+                                 cookies={'auth_pubtkt': self.cookie()},
+                                 **kwargs)
+        if resp.status_code == 401:
+            resp = self.http.request(
+                method, url, cookies={'auth_pubtkt': self.cookie(True)},
+                **kwargs)
+        return resp
+
+    def gerrit(self):
+        """ Return a GerritUtils client using the session cookie """
+        cookie = self.cookie()
+        if self._gerrit is None:
+            self._gerrit = GerritUtils('http://' + self.host,
+                                       auth_cookie=cookie)
+        return self._gerrit
+
+
+# Per process registry, sessions are not shared with forked workers
+_SESSIONS = {}
+
+
+def http():
+    """ Return the process wide unauthenticated requests.Session """
+    key = (os.getpid(), None)
+    if key not in _SESSIONS:
+        _SESSIONS[key] = requests.Session()
+    return _SESSIONS[key]
+
+
+def session(host, user, passwd):
+    """ Return the process wide SfSession of user on host """
+    key = (os.getpid(), host, user)
+    if key not in _SESSIONS:
+        _SESSIONS[key] = SfSession(host, user, passwd)
+    return _SESSIONS[key]
+
+
+def _generate_key(bits):
+    key = RSA.generate(bits)
+    return key.exportKey('PEM'), key.publickey().exportKey('OpenSSH')
+
+
+def generate_keys(count, bits=None, jobs=None):
+    """ Generate count RSA key pairs in parallel
+
+    Return a list of (PEM private key, OpenSSH public key) tuples.
+    """
+    bits = bits or config.replication_key_bits
+    if count <= 1:
+        return [_generate_key(bits) for _ in range(count)]
+    # Workers must not share the random pool state of the parent
+    pool = multiprocessing.Pool(jobs, Random.atfork)
+    try:
+        return pool.map(_generate_key, [bits] * count)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def wait_github_repo(org, repo, token, need_content=False, timeout=60,
+                     api=ghclient.API):
+    """ Wait for a Github repository to be created (and filled)
+
+    Github creates repositories, and copies forks, asynchronously.
+    """
+    url = '%s/repos/%s/%s' % (api, org, repo)
+    if need_content:
+        url += '/branches'
+    headers = {'Authorization': 'token %s' % token}
+    deadline = time.time() + timeout
+    delay = 0.5
+    while True:
+        resp = http().get(url, headers=headers)
+        if resp.ok and (not need_content or resp.json()):
+            return
+        if time.time() + delay > deadline:
+            raise SFManagerException("Github repository %s/%s not ready "
+                                     "(%s)" % (org, repo, resp.status_code))
+        time.sleep(delay)
+        delay = min(delay * 2, 8)
+
+
+def wait_replication_reload(configured, remotes, gerrit=None):
+    """ Wait for Gerrit to load the replication config of remotes, last
+    changed at time configured
+
+    Replicating before would skip the new remotes. With a GerritSfUtils
+    the loaded remotes are listed until they are all there, otherwise
+    (or if they cannot be listed) the wait lasts until
+    config.replication_reload_wait seconds after the change.
+    """
+    deadline = configured + config.replication_reload_wait
+    delay = 0.5
+    while gerrit is not None:
+        loaded = gerrit.replication_remotes()
+        if loaded is None:
+            break
+        if set(remotes) <= loaded:
+            return
+        if time.time() + delay > deadline:
+            raise SFManagerException(
+                "Replication config of %s not loaded by Gerrit" % ", ".join(
+                    sorted(set(remotes) - loaded)))
+        time.sleep(delay)
+        delay = min(delay * 2, 4)
+    wait = deadline - time.time()
+    if wait > 0:
+        print "Wait %.1fs for Gerrit to reload the replication config" % wait
+        time.sleep(wait)
+
+
+_JSON_FOLLOW = re.compile(r'[ \t\r\n]*([,:}])')
+
+
+def iter_json_object(chunks):
+    """ Yield the (key, value) items of a JSON object read from chunks
+
+    Only one item of the object is decoded at a time, chunks is an
+    iterable of strings such as Response.iter_content().
+    """
+    decoder = json.JSONDecoder()
+    chunks = iter(chunks)
+    buf = ''
+    pos = 0
+    eof = False
+    expect = '{'
+    while True:
+        # Skip the separators, keeping only what is left to decode
+        while pos < len(buf) and buf[pos] in ' \t\r\n':
+            pos += 1
+        if pos < len(buf) and expect in ('{', ':') and buf[pos] == expect:
+            pos += 1
+            expect = 'value' if expect == ':' else 'key'
+            continue
+        if pos < len(buf) and expect == 'key' and buf[pos] in ',}':
+            if buf[pos] == '}':
+                return
+            pos += 1
+            continue
+        if pos < len(buf) and expect in ('key', 'value'):
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                obj, end = None, None
+            # A number may be truncated (-25 of -25.0, 1 of 1e3): a value
+            # is only accepted once the separator after it is read
+            follow = end is not None and _JSON_FOLLOW.match(buf, end)
+            if end is not None and (eof or follow and follow.group(1) in (
+                    ':' if expect == 'key' else ',}')):
+                pos = end
+                if expect == 'key':
+                    key = obj
+                    expect = ':'
+                else:
+                    yield key, obj
+                    expect = 'key'
+                continue
+        if eof:
+            raise ValueError("Truncated or invalid JSON object")
+        try:
+            buf = buf[pos:] + next(chunks)
+            pos = 0
+        except StopIteration:
+            eof = True
+
+
+class ProjectInventory(object):
+    """ Snapshot of the list of projects hosted on a Software Factory
+
+    The list is fetched on first use and kept until invalidate() is
+    called, then revalidated with a conditional request.
+    """
+    def __init__(self, host):
+        self.host = host
+        self._etag = None
+        self._names = None
+        self._basenames = None
+        self._stale = True
+
+    def invalidate(self):
+        self._stale = True
+
+    def _load(self):
+        if not self._stale:
+            return
+        headers = {}
+        if self._etag and self._names is not None:
+            headers['If-None-Match'] = self._etag
+        resp = http().get('http://%s/r/projects/?d' % self.host,
+                          headers=headers)
+        if resp.status_code != 304:
+            resp.raise_for_status()
+            # Skip the Gerrit XSSI protection prefix
+            names = json.loads(resp.text[4:])
+            self._names = set(names)
+            self._basenames = set(os.path.basename(n) for n in names)
+            self._etag = resp.headers.get('ETag')
+        self._stale = False
+
+    def names(self, basenames=False):
+        self._load()
+        if basenames:
+            return self._basenames
+        return self._names
+
+    def status(self, name, basenames=True):
+        """ Return 2 if name and its distgit are imported, 1 if only one
+        of them is (inconsistent), 0 if none is.
+        """
+        names = self.names(basenames)
+        return (name in names) + (name + '-distgit' in names)
+
+    def classify(self, projects):
+        """ Return a {status: [projects]} dict for all the statuses """
+        ret = {0: [], 1: [], 2: []}
+        for project in projects:
+            ret[self.status(project)].append(project)
+        return ret
+
+
+def inventory(host):
+    """ Return the process wide ProjectInventory of host """
+    key = (os.getpid(), host, 'inventory')
+    if key not in _SESSIONS:
+        _SESSIONS[key] = ProjectInventory(host)
+    return _SESSIONS[key]
+
+
 class Tool:
     def __init__(self):
         self.debug = None
@@ -50,6 +326,7 @@ class Tool:
         if self.debug:
             self.debug.write("\n\ncmd = %s\n" % cmd)
             self.debug.flush()
+        start = time.time()
         cmd = shlex.split(cmd)
         ocwd = os.getcwd()
         if cwd:
@@ -61,37 +338,124 @@ class Tool:
             output = p.communicate()[0]
             if self.debug:
                 self.debug.write(output)
+                self.debug.write("(%.3fs)\n" % (time.time() - start))
         finally:
             os.chdir(ocwd)
         return output, p.returncode
 
 
 class GerritSfUtils(Tool):
+    # Seconds to wait for a merge
+    merge_timeout = 63
+
     def __init__(self, host, user):
         Tool.__init__(self)
         self.host = host
         self.user = user
-        self.cmd = "ssh -l %s -p 29418 %s gerrit " % (self.user, self.host)
+        self.cmd = "%s -l %s -p 29418 %s gerrit " % (
+            sshmux.ssh_command(), self.user, self.host)
 
-    def approve_and_wait_for_merge(self, sha):
-        cmd = self.cmd + "review --code-review +2 --workflow +1 %s" % sha
-        self.exe(cmd)
+    def exe(self, cmd, cwd=None):
+        sshmux.count_session()
+        return Tool.exe(self, cmd, cwd)
+
+    def _stream_events(self):
+        """ Start gerrit stream-events, return the process and a Queue
+        of its output lines, None is queued when the stream ends
+        """
+        with open(os.devnull, 'w') as devnull:
+            proc = subprocess.Popen(shlex.split(self.cmd + "stream-events"),
+                                    stdout=subprocess.PIPE, stderr=devnull,
+                                    env=self.env)
+        sshmux.count_session()
+        lines = Queue()
+
+        def reader():
+            for line in iter(proc.stdout.readline, ''):
+                lines.put(line)
+            lines.put(None)
+        t = threading.Thread(target=reader)
+        t.daemon = True
+        t.start()
+        return proc, lines
+
+    def _is_merged(self, sha):
         cmd = self.cmd + "query --format JSON --current-patch-set %s" % sha
-        attempts = 0
-        infos = {}
-        infos['status'] = None
-        while 'status' in infos and infos['status'] != "MERGED":
-            out, _ = self.exe(cmd)
-            infos = json.loads(out.split('\n')[0])
+        out, _ = self.exe(cmd)
+        infos = json.loads(out.split('\n')[0])
+        # Only the stats row is returned for an unknown change
+        return infos.get('status', 'MERGED') == 'MERGED'
+
+    def _wait_for_event(self, sha, lines, deadline):
+        """ Return True when change-merged is received for sha, False
+        if the stream ended first, raise on timeout
+        """
+        while True:
+            try:
+                line = lines.get(timeout=max(0, deadline - time.time()))
+            except Empty:
+                raise UnableToMergeException("Timeout exceeded")
+            if line is None:
+                return False
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+            if event.get('type') == 'change-merged' and \
+                    event.get('patchSet', {}).get('revision') == sha:
+                return True
+
+    def _poll(self, sha, deadline):
+        delay = 0.5
+        while not self._is_merged(sha):
             print "Waiting to be merged ..."
-            if attempts >= 21:
+            if time.time() + delay > deadline:
                 raise UnableToMergeException("Timeout exceeded")
-            time.sleep(3)
-            attempts += 1
+            time.sleep(delay)
+            delay = min(delay * 2, 8)
+
+    def replication_remotes(self):
+        """ Return the names of the replication remotes loaded by Gerrit,
+        or None if the replication plugin cannot list them
+
+        Listing them also makes the plugin reload a changed config.
+        """
+        out, code = self.exe(self.cmd + "replication list")
+        if code:
+            return None
+        return set(m.group(1) for m in re.finditer(r'^Remote: *(\S+)', out,
+                                                   re.MULTILINE))
+
+    def start_replication(self, projects):
+        """ Replicate projects now, the --wait is not used """
+        out, code = self.exe(self.cmd + "replication start %s" %
+                             " ".join(projects))
+        if code:
+            raise SFManagerException(out)
+
+    def approve_and_wait_for_merge(self, sha):
+        deadline = time.time() + self.merge_timeout
+        # Subscribe before the review so the merge event is not missed
+        proc, lines = self._stream_events()
+        try:
+            cmd = self.cmd + "review --code-review +2 --workflow +1 %s" % sha
+            self.exe(cmd)
+            # The change may be merged before the stream was listening
+            if not self._is_merged(sha):
+                print "Waiting to be merged ..."
+                if not self._wait_for_event(sha, lines, deadline):
+                    # stream-events is not allowed or the stream broke
+                    self._poll(sha, deadline)
+        finally:
+            if proc.poll() is None:
+                proc.terminate()
+            proc.wait()
         print "Merged."
 
 
-class ManageSfUtils(Tool):
+class ManageSfCliUtils(Tool):
+    """ ManageSfUtils implementation running a sfmanager command per call
+    """
     def __init__(self, url, user, passwd):
         Tool.__init__(self)
         self.url = url
@@ -99,6 +463,13 @@ class ManageSfUtils(Tool):
         self.passwd = passwd
         self.base_cmd = "sfmanager --url %s " \
             "--auth %s:%s " % (url, user, passwd)
+        self.keys = []
+        self.pending = []
+        self.configured = 0
+
+    def prepare_keys(self, count):
+        """ Generate ahead the keys of count replications """
+        self.keys.extend(generate_keys(count))
 
     def createProject(self, name, options=None):
         cmd = self.base_cmd + " project create --name %s " % name
@@ -119,36 +490,74 @@ class ManageSfUtils(Tool):
     def replicateProjectGithub(self, repo, fork, token,
                                org="rdo-packages",
                                skip_github_creation=False,
-                               need_fork=False):
+                               need_fork=False, trigger=True):
 
-        print "Create key pair for the replication on github ..."
-        key = RSA.generate(4096)
+        if self.keys:
+            priv, pub = self.keys.pop()
+        else:
+            print "Create key pair for the replication on github ..."
+            priv, pub = _generate_key(config.replication_key_bits)
+            print "Done."
 
         privkey = tempfile.NamedTemporaryFile(delete=False)
-        privkey.write(key.exportKey('PEM'))
+        privkey.write(priv)
         privkey.close()
 
         pubkey = tempfile.NamedTemporaryFile(delete=False)
-        pubkey.write(key.publickey().exportKey('OpenSSH'))
+        pubkey.write(pub)
         pubkey.close()
-        print "Done."
+        try:
+            self._replicate(repo, fork, token, org, skip_github_creation,
+                            need_fork, privkey.name, pubkey.name)
+        finally:
+            os.unlink(privkey.name)
+            os.unlink(pubkey.name)
+        self.pending.append(repo)
+        self.configured = time.time()
+        if trigger:
+            self.triggerReplication()
+
+    def triggerReplication(self, ssh_user=None):
+        """ Replicate the pending repositories once Gerrit has reloaded
+        their config, only them when ssh_user can use gerrit over ssh
+        """
+        pending, self.pending = self.pending, []
+        if ssh_user:
+            host = urlparse.urlparse(self.url).netloc
+            gerrit = GerritSfUtils(host, ssh_user)
+            wait_replication_reload(self.configured, pending, gerrit)
+            gerrit.start_replication(pending)
+            return
+        wait_replication_reload(self.configured, pending)
+        cmd = "%s replication trigger" % self.base_cmd
+        print cmd
+        out, code = self.exe(cmd)
+        if code:
+            raise SFManagerException(out)
+
+    def _replicate(self, repo, fork, token, org, skip_github_creation,
+                   need_fork, privkey, pubkey):
 
-        cmds = []
         if not skip_github_creation:
             if need_fork:
-                cmds.append(
-                    " --github-token %s github fork-repo "
-                    "--fork %s --name %s --org %s" % (token, fork, repo, org))
+                cmd = " --github-token %s github fork-repo " \
+                    "--fork %s --name %s --org %s" % (token, fork, repo, org)
             else:
-                cmds.append(
-                    " --github-token %s github create-repo "
-                    "--name %s --org %s" % (token, repo, org))
+                cmd = " --github-token %s github create-repo " \
+                    "--name %s --org %s" % (token, repo, org)
+            print self.base_cmd + cmd
+            out, code = self.exe(self.base_cmd + cmd)
+            if code:
+                raise SFManagerException(out)
+            # The deploy key needs the repository
+            wait_github_repo(org, repo, token, need_content=need_fork)
         else:
             print "Skip github repo creation by fork. Just configure" \
                   " the replication."
+        cmds = []
         cmds.append(
             " --github-token %s github deploy-key "
-            "-n %s -o %s --keyfile %s" % (token, repo, org, pubkey.name))
+            "-n %s -o %s --keyfile %s" % (token, repo, org, pubkey))
         # Clean first to avoid duplicated items
         cmds.append(
             " replication configure remove --section %s" % repo)
@@ -159,21 +568,13 @@ class ManageSfUtils(Tool):
             " replication configure add --section %s "
             "projects %s" % (repo, repo))
         cmds.append(" gerrit_ssh_config add --alias alias_gh_%s "
-                    "--key %s --hostname github.com" % (repo, privkey.name))
+                    "--key %s --hostname github.com" % (repo, privkey))
 
         for cmd in cmds:
             print self.base_cmd + cmd
             out, code = self.exe(self.base_cmd + cmd)
             if code:
                 raise SFManagerException(out)
-            time.sleep(0.5)
-
-        time.sleep(15)
-        cmd = "%s replication trigger" % self.base_cmd
-        print cmd
-        out, code = self.exe(cmd)
-        if code:
-            raise SFManagerException(out)
 
     def addUsertoProjectGroups(self, project, email, groups):
         cmd = self.base_cmd + " membership add --project %s " % project
@@ -196,17 +597,206 @@ class ManageSfUtils(Tool):
             raise SFManagerException(out)
         return out
 
-    def listAllProjectDetails(self):
+    def listAllProjectDetails(self, names=None):
         auth_cookie = {'auth_pubtkt': get_cookie(self.url.lstrip('http://'),
                                                  self.user, self.passwd)}
-        return requests.get(self.url + "/manage/project/",
-                            cookies=auth_cookie).json()
+        infos = requests.get(self.url + "/manage/project/",
+                             cookies=auth_cookie).json()
+        if names is None:
+            return infos
+        return dict((n, {'groups': infos[n]['groups']})
+                    for n in names if n in infos)
+
+    def getProjectDetails(self, name):
+        return self.listAllProjectDetails()[name]
+
+
+class ManageSfUtils(Tool):
+    """ Software Factory management API client
+
+    Calls the managesf REST API (and the Github API for the replication)
+    through the process wide sessions.
+    """
+    github_api = ghclient.API
+
+    def __init__(self, url, user, passwd):
+        Tool.__init__(self)
+        self.url = url
+        self.user = user
+        self.passwd = passwd
+        self.keys = []
+        self.pending = []
+        self.configured = 0
+        self.session = session(urlparse.urlparse(url).netloc, user, passwd)
+
+    def _call(self, method, url, ok_codes=(), auth=True, **kwargs):
+        start = time.time()
+        if auth:
+            resp = self.session.request(method, url, **kwargs)
+        else:
+            resp = self.session.http.request(method, url, **kwargs)
+        if self.debug:
+            self.debug.write("%s %s: %s (%.3fs)\n" % (
+                method, url, resp.status_code, time.time() - start))
+            self.debug.flush()
+        if not resp.ok and resp.status_code not in ok_codes:
+            raise SFManagerException("%s %s failed (%s): %s" % (
+                method, url, resp.status_code, resp.text))
+        return resp
+
+    def _manage(self, method, path, **kwargs):
+        return self._call(method, '%s/manage/%s' % (self.url, path),
+                          **kwargs)
+
+    def _github(self, method, path, token, **kwargs):
+        headers = {'Authorization': 'token %s' % token}
+        return self._call(method, self.github_api + path, auth=False,
+                          headers=headers, **kwargs)
+
+    @staticmethod
+    def _project_id(name):
+        # Same encoding as sfmanager for namespaced projects
+        if '/' in name:
+            return '===' + base64.urlsafe_b64encode(name)
+        return name
+
+    def createProject(self, name, options=None):
+        data = {}
+        for k, v in (options or {}).items():
+            # Flags are given with an empty value, descriptions are
+            # quoted for the shell by callers
+            data[k] = v.strip('"') if v else True
+        try:
+            self._manage('PUT', 'project/%s/' % self._project_id(name),
+                         json=data)
+        finally:
+            inventory(self.session.host).invalidate()
+
+    def deleteProject(self, name):
+        try:
+            self._manage('DELETE', 'project/%s/' % self._project_id(name),
+                         ok_codes=(404,))
+        finally:
+            inventory(self.session.host).invalidate()
+
+    def prepare_keys(self, count):
+        """ Generate ahead the keys of count replications """
+        self.keys.extend(generate_keys(count))
+
+    def _github_create(self, repo, fork, token, org, need_fork):
+        if need_fork:
+            owner, fork_name = urlparse.urlparse(fork).path.strip(
+                '/').split('/')[-2:]
+            self._github('POST', '/repos/%s/%s/forks' % (owner, fork_name),
+                         token, json={'organization': org})
+            # The rename and the deploy key need the fork to be copied
+            self._wait_github(org, fork_name, token, need_content=True)
+            if fork_name != repo:
+                self._github('PATCH', '/repos/%s/%s' % (org, fork_name),
+                             token, json={'name': repo})
+                self._wait_github(org, repo, token)
+        else:
+            self._github('POST', '/orgs/%s/repos' % org, token,
+                         json={'name': repo})
+            self._wait_github(org, repo, token)
+
+    def _wait_github(self, org, repo, token, need_content=False):
+        wait_github_repo(org, repo, token, need_content=need_content,
+                         api=self.github_api)
+
+    def replicateProjectGithub(self, repo, fork, token,
+                               org="rdo-packages",
+                               skip_github_creation=False,
+                               need_fork=False, trigger=True):
+        """ Configure the replication of repo to org on Github
+
+        Without trigger the replication is only started by the next
+        triggerReplication call, so that a batch of repositories is
+        replicated once.
+        """
+        if self.keys:
+            priv, pub = self.keys.pop()
+        else:
+            print "Create key pair for the replication on github ..."
+            priv, pub = _generate_key(config.replication_key_bits)
+            print "Done."
+
+        if not skip_github_creation:
+            self._github_create(repo, fork, token, org, need_fork)
+        else:
+            print "Skip github repo creation by fork. Just configure" \
+                  " the replication."
+        self._github('POST', '/repos/%s/%s/keys' % (org, repo), token,
+                     json={'title': 'Gerrit replication (%s)' % repo,
+                           'key': pub,
+                           'read_only': False})
+        # Clean first to avoid duplicated items
+        self._manage('DELETE', 'replication/%s/' % repo, ok_codes=(404,))
+        self._manage('PUT', 'replication/%s/url/' % repo,
+                     json={'value': 'git@alias_gh_%s:%s/${name}.git' % (
+                         repo, org)})
+        self._manage('PUT', 'replication/%s/projects/' % repo,
+                     json={'value': repo})
+        self._manage('PUT', 'sshconfig/alias_gh_%s/' % repo,
+                     json={'hostname': 'github.com',
+                           'identityfile_content': priv})
+        self.pending.append(repo)
+        self.configured = time.time()
+        if trigger:
+            self.triggerReplication()
+
+    def triggerReplication(self, ssh_user=None):
+        """ Replicate the pending repositories once Gerrit has reloaded
+        their config, only them when ssh_user can use gerrit over ssh
+        """
+        pending, self.pending = self.pending, []
+        if ssh_user:
+            gerrit = GerritSfUtils(self.session.host, ssh_user)
+            wait_replication_reload(self.configured, pending, gerrit)
+            gerrit.start_replication(pending)
+            return
+        wait_replication_reload(self.configured, pending)
+        self._manage('POST', 'replication/', json={})
+
+    def addUsertoProjectGroups(self, project, email, groups):
+        self._manage('PUT', 'project/membership/%s/%s/' % (
+            self._project_id(project), email),
+            json={'groups': groups.split()})
+
+    def deleteUserFromProjectGroup(self, project, email, group):
+        self._manage('DELETE', 'project/membership/%s/%s/%s/' % (
+            self._project_id(project), email, group))
 
+    def listRegisteredUsers(self):
+        return self._manage('GET', 'project/membership/').text
+
+    def listAllProjectDetails(self, names=None):
+        """ Return the details of all projects
+
+        When names is given the response is parsed while it is read and
+        only the groups of those projects are kept.
+        """
+        if names is None:
+            return self._manage('GET', 'project/').json()
+        names = set(names)
+        resp = self._manage('GET', 'project/', stream=True)
+        try:
+            return dict((n, {'groups': details['groups']})
+                        for n, details in iter_json_object(
+                            resp.iter_content(64 * 1024))
+                        if n in names)
+        finally:
+            resp.close()
 
-def get_github_user_by_mail(email):
+    def getProjectDetails(self, name):
+        return self._manage('GET',
+                            'project/%s/' % self._project_id(name)).json()
+
+
+def get_github_user_by_mail(email, token=None):
     """Retrieves user info from Github from an email address"""
-    endpoint = "https://api.github.com/search/users?q=%s+in%%3Aemail"
-    user_info = requests.get(endpoint % email).json()
+    gh = ghclient.client(token)
+    user_info = gh.get("/search/users?q=%s+in%%3Aemail" % email)
     print user_info
     user_info = user_info['items']
     if not user_info:
@@ -215,8 +805,7 @@ def get_github_user_by_mail(email):
     login = user_info['login']
     full_name = login
     # fech ssh keys
-    endpoint = "https://api.github.com/users/%s/keys"
-    keys = requests.get(endpoint % login).json()
+    keys = gh.get("/users/%s/keys" % login)
     ssh_keys = [{"key": s["key"]} for s in keys]
     return {"username": login,
             "email": email,
@@ -224,9 +813,13 @@ def get_github_user_by_mail(email):
             "ssh_keys": ssh_keys}
 
 
-def get_github_user_by_username(username):
-    endpoint = "https://api.github.com/users/%s" % username
-    user_info = requests.get(endpoint).json()
+def get_github_user_by_username(username, token=None):
+    gh = ghclient.client(token)
+    endpoint = "/users/%s" % username
+    try:
+        user_info = gh.get(endpoint)
+    except requests.HTTPError:
+        user_info = {}
     if username != user_info.get('login'):
         raise Exception("No user found")
     email = user_info.get('email')
@@ -236,7 +829,7 @@ def get_github_user_by_username(username):
                "after automated provisioning might fail.")
     full_name = username
     # fetch ssh keys
-    keys = requests.get(endpoint + "/keys").json()
+    keys = gh.get(endpoint + "/keys")
     ssh_keys = [{"key": s["key"] for s in keys}]
     return {"username": username,
             "email": email,
@@ -245,35 +838,29 @@ def get_github_user_by_username(username):
 
 
 def provision_user(sf_url, username, password, user_data):
-    auth_cookie = {'auth_pubtkt': get_cookie(sf_url, username, password)}
-    return requests.post('http://' + sf_url + "/manage/services_users/",
-                         json=user_data,
-                         cookies=auth_cookie)
+    return session(sf_url, username, password).request(
+        'POST', "/manage/services_users/", json=user_data)
 
 
 def delete_user(sf_url, login, password, username=None, email=None):
-    auth_cookie = {'auth_pubtkt': get_cookie(sf_url, login, password)}
+    s = session(sf_url, login, password)
     if username:
         query = '?username=%s' % username
-        requests.delete('http://' + sf_url + "/manage/services_users/" + query,
-                        cookies=auth_cookie)
+        s.request('DELETE', "/manage/services_users/" + query)
     # if both are given we'll just be extra cautious and delete two times
     if email:
         query = '?email=%s' % email
-        requests.delete('http://' + sf_url + "/manage/services_users/" + query,
-                        cookies=auth_cookie)
+        s.request('DELETE', "/manage/services_users/" + query)
 
 
 def get_group_id(sf_url, username, password, grpname):
-    c = GerritUtils('http://' + sf_url,
-                    auth_cookie=get_cookie(sf_url, username, password))
+    c = session(sf_url, username, password).gerrit()
     return c.get_group_id(grpname)
 
 
 def add_group_in_gerrit_group(sf_url, username, password, in_id,
                               to_include_id):
-    c = GerritUtils('http://' + sf_url,
-                    auth_cookie=get_cookie(sf_url, username, password))
+    c = session(sf_url, username, password).gerrit()
     try:
         c.g.get('groups/%s/groups/%s' % (in_id, to_include_id))
         print '%s Already included in %s !' % (to_include_id, in_id)
@@ -26,6 +26,7 @@ import shutil
 import os
 import copy
 
+from sfrdo import gitcache
 from sfrdo import rdoinfoutils
 
 
@@ -43,7 +44,7 @@ def nuke_dir(dir):
 
 def clone(repo, root_dir):
     if not os.path.isdir(root_dir):
-        git('clone', repo, root_dir)
+        gitcache.clone(repo, root_dir)
 
 
 def get_commit_time(commit_id):
@@ -97,9 +98,7 @@ def get_projects_status(sf_url, user, release,
         version, infos, repos = get_repos_infos_for_project(descriptor)
         for project in infos.keys():
             try:
-                (name, distgit, upstream, sfdistgit, maints,
-                 conf, mdistgit, patches) = rdoinfoutils.fetch_project_infos(
-                    rdoinfo, project)
+                name = rdoinfoutils.get_index(rdoinfo).get(project).name
             except Exception as e:
                 print "Skipping %s: %s" % (project, e)
                 missing_from_rdo[project] = os_git_root + repos.get(project)
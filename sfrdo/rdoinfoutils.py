@@ -17,9 +17,19 @@
 
 import imp
 import os
+import time
+import json
+import hashlib
+import logging
+import tempfile
 import urlparse
+import cPickle as pickle
+
+from collections import namedtuple
 
 from rdopkg.repoman import RepoManager
+from rdopkg.utils.cmd import git
+from rdopkg.utils.exception import CommandFailed
 
 from sfrdo import config
 
@@ -144,60 +154,222 @@ RDOINFOS_FIXES = {
 }
 
 
-def fetch_rdoinfo(repo=None):
+def _rdoinfo_cache_dir():
+    cachedir = os.path.join(config.userdir, 'rdoinfo-cache')
+    if not os.path.isdir(cachedir):
+        os.makedirs(cachedir)
+    return cachedir
+
+
+def _load_cache_state(path):
+    try:
+        return json.load(file(path))
+    except (IOError, ValueError):
+        return {}
+
+
+def _write_atomic(path, dump, data):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, 'wb') as f:
+        dump(data, f)
+    os.rename(tmp, path)
+
+
+def _remote_master_sha(repo):
+    out = git('ls-remote', repo, 'refs/heads/master', log_cmd=False)
+    return out.split()[0] if out else None
+
+
+def _parse_rdoinfo(repo):
+    rm = RepoManager(config.userdir, repo, verbose=True)
+    rm.init(force_fetch=True)
+    with rm.repo_dir():
+        sha = git('rev-parse', 'HEAD', log_cmd=False)
+    file, path, desc = imp.find_module('rdoinfo', [rm.repo_path])
+    rdoinfo = imp.load_module('rdoinfo', file, path, desc)
+    return sha, rdoinfo.parse_info_file(os.path.join(rm.repo_path,
+                                                     'rdo.yml'))
+
+
+def fetch_rdoinfo(repo=None, refresh=False):
+    """ Return the parsed rdoinfo database.
+
+    Parsed snapshots are cached under userdir, keyed by the rdoinfo
+    commit SHA. Within config.rdoinfo_cache_ttl the last snapshot is
+    used as is, then a ls-remote tells whether a fetch and re-parse
+    is needed. refresh forces the fetch.
+    """
     if not os.path.isdir(config.userdir):
         os.mkdir(config.userdir)
     rdoinfo_repo = config.rdoinfo
     if repo:
         rdoinfo_repo = repo
-    rm = RepoManager(config.userdir, rdoinfo_repo, verbose=True)
-    rm.init(force_fetch=True)
-    file, path, desc = imp.find_module('rdoinfo', [rm.repo_path])
-    rdoinfo = imp.load_module('rdoinfo', file, path, desc)
-    return rdoinfo.parse_info_file(os.path.join(config.userdir,
-                                                'rdoinfo/rdo.yml'))
+    cachedir = _rdoinfo_cache_dir()
+    state_path = os.path.join(
+        cachedir, '%s.json' % hashlib.sha1(rdoinfo_repo).hexdigest())
+    state = _load_cache_state(state_path)
+
+    def snapshot_path(sha):
+        return os.path.join(cachedir, '%s.pickle' % sha)
+
+    def load_snapshot(sha):
+        try:
+            with open(snapshot_path(sha), 'rb') as f:
+                return pickle.load(f)
+        except (IOError, EOFError, pickle.UnpicklingError):
+            return None
+
+    sha = state.get('sha')
+    if not refresh and sha:
+        if time.time() - state.get('checked', 0) < config.rdoinfo_cache_ttl:
+            rdoinfo = load_snapshot(sha)
+            if rdoinfo is not None:
+                logging.debug("rdoinfo %s loaded from cache" % sha)
+                return rdoinfo
+        try:
+            remote_sha = _remote_master_sha(rdoinfo_repo)
+        except CommandFailed, e:
+            remote_sha = None
+            logging.warning("Unable to check rdoinfo remote HEAD: %s" % e)
+        if remote_sha is None or remote_sha == sha:
+            rdoinfo = load_snapshot(sha)
+            if rdoinfo is not None:
+                if remote_sha:
+                    state['checked'] = time.time()
+                    _write_atomic(state_path, json.dump, state)
+                logging.debug("rdoinfo %s loaded from cache" % sha)
+                return rdoinfo
+
+    sha, rdoinfo = _parse_rdoinfo(rdoinfo_repo)
+    _write_atomic(snapshot_path(sha),
+                  lambda d, f: pickle.dump(d, f, pickle.HIGHEST_PROTOCOL),
+                  rdoinfo)
+    _write_atomic(state_path, json.dump,
+                  {'repo': rdoinfo_repo, 'sha': sha, 'checked': time.time()})
+    return rdoinfo
+
+
+class LazyRdoInfo(object):
+    """ rdoinfo handle that fetches and parses rdoinfo on first access """
+    def __init__(self, repo=None, refresh=False):
+        self.repo = repo
+        self.refresh = refresh
+        self._rdoinfo = None
+
+    @property
+    def loaded(self):
+        return self._rdoinfo is not None
+
+    def get(self):
+        if self._rdoinfo is None:
+            start = time.time()
+            self._rdoinfo = fetch_rdoinfo(repo=self.repo,
+                                          refresh=self.refresh)
+            logging.debug("rdoinfo (%s) loaded in %.3fs" % (
+                self.repo or config.rdoinfo, time.time() - start))
+        return self._rdoinfo
+
+    def __getitem__(self, key):
+        return self.get()[key]
+
+    def __contains__(self, key):
+        return key in self.get()
+
+
+ProjectInfos = namedtuple('ProjectInfos', ['name', 'distgit', 'upstream',
+                                           'sfdistgit', 'maints', 'conf',
+                                           'mdistgit'])
+
+
+class RdoInfoIndex(object):
+    """ Lookup tables over rdoinfo packages.
+
+    Packages are indexed by project name and by conf type. A name that is
+    not a project name is looked up as before, by scanning for the first
+    upstream URL ending with it, once per name. Records returned by get()
+    have the RDOINFOS_FIXES of the looked up name applied.
+    """
+    def __init__(self, rdoinfo):
+        self._packages = {}
+        self._records = {}
+        self._by_type = {'All': [], 'None': []}
+        self._ordered = []
+        for pkg in rdoinfo['packages']:
+            name = pkg['project']
+            self._ordered.append(pkg)
+            self._packages.setdefault(name, pkg)
+            self._by_type['All'].append(name)
+            self._by_type.setdefault(pkg.get('conf', 'None'), []).append(name)
+        self._suffix_hits = {}
+
+    def _record(self, pkg, lookup):
+        distgit = pkg['distgit']
+        # Change scheme from ssh to git (avoid the need of being
+        # authenticated). For some projects we need it
+        # (eg. client project) still hosted fedora side.
+        parts = urlparse.urlparse(distgit)
+        distgit = urlparse.urlunparse(['git', parts.netloc,
+                                       parts.path, '', '', ''])
+        conf = pkg.get('conf', 'None')
+        fixes = RDOINFOS_FIXES.get(lookup, {})
+        distgit = fixes.get('distgit', distgit)
+        conf = fixes.get('conf', conf)
+        name = pkg['project']
+        return ProjectInfos(name, distgit, pkg['upstream'],
+                            "%s-distgit" % name, pkg['maintainers'],
+                            conf, pkg['master-distgit'])
+
+    def package(self, upstream_project_name):
+        """ Return the raw rdoinfo package or None """
+        pkg = self._packages.get(upstream_project_name)
+        if pkg is None:
+            # some projects differ from the upstream name
+            # (ex: oslo.* is oslo-*) so look again by using the upstream url
+            if upstream_project_name not in self._suffix_hits:
+                self._suffix_hits[upstream_project_name] = next(
+                    (p for p in self._ordered
+                     if p['upstream'].endswith(upstream_project_name)),
+                    None)
+            pkg = self._suffix_hits[upstream_project_name]
+        return pkg
+
+    def get(self, upstream_project_name):
+        if upstream_project_name not in self._records:
+            pkg = self.package(upstream_project_name)
+            if pkg is None:
+                # yup, out of luck now
+                raise Exception('Project not found in rdoinfo: %s' %
+                                upstream_project_name)
+            self._records[upstream_project_name] = self._record(
+                pkg, upstream_project_name)
+        return self._records[upstream_project_name]
+
+    def projects_of_type(self, t='None'):
+        return list(self._by_type.get(t, []))
+
+
+_INDEXES = {}
+
+
+def get_index(rdoinfo):
+    """ Return the RdoInfoIndex of rdoinfo, built once per process """
+    if isinstance(rdoinfo, LazyRdoInfo):
+        rdoinfo = rdoinfo.get()
+    key = id(rdoinfo)
+    if key not in _INDEXES:
+        # Keep a reference on rdoinfo so that its id is not reused
+        _INDEXES[key] = (rdoinfo, RdoInfoIndex(rdoinfo))
+    return _INDEXES[key][1]
 
 
 def fetch_project_infos(rdoinfo, upstream_project_name):
-    select = [pkg for pkg in rdoinfo['packages']
-              if pkg['project'] == upstream_project_name]
-    if not select:
-        # some projects differ from the upstream name (ex: oslo.* is oslo-*)
-        # so look again by using the upstream url
-        select = [pkg for pkg in rdoinfo['packages']
-                  if pkg['upstream'].endswith(upstream_project_name)]
-    if not select:
-        # yup, out of luck now
-        raise Exception('Project not found in rdoinfo: %s' %
-                        upstream_project_name)
-    infos = select[0]
-
-    distgit = infos['distgit']
-    # Change scheme from ssh to git (avoid the need of being authenticated)
-    # For some projects we need it
-    # (eg. client project) still hosted fedora side.
-    parts = urlparse.urlparse(distgit)
-    distgit = urlparse.urlunparse(['git', parts.netloc,
-                                   parts.path, '', '', ''])
-    conf = 'None'
-    if 'conf' in infos:
-        conf = infos['conf']
-
-    if upstream_project_name in RDOINFOS_FIXES:
-        if 'distgit' in RDOINFOS_FIXES[upstream_project_name]:
-            print "Distgit target has been fixed by sfrdo !"
-            distgit = RDOINFOS_FIXES[upstream_project_name]['distgit']
-        if 'conf' in RDOINFOS_FIXES[upstream_project_name]:
-            print "Conf type has been fixed by sfrdo !"
-            conf = RDOINFOS_FIXES[upstream_project_name]['conf']
-
-    mdistgit = infos['master-distgit']
-    upstream = infos['upstream']
-    name = infos['project']
-    maints = infos['maintainers']
-    sfdistgit = "%s-distgit" % name
-    return (name, distgit, upstream,
-            sfdistgit, maints, conf, mdistgit)
+    infos = get_index(rdoinfo).get(upstream_project_name)
+    fixes = RDOINFOS_FIXES.get(upstream_project_name, {})
+    if 'distgit' in fixes:
+        print "Distgit target has been fixed by sfrdo !"
+    if 'conf' in fixes:
+        print "Conf type has been fixed by sfrdo !"
+    return infos
 
 
 def display_details(cmdargs, rdoinfo, workdir=None):
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016 Red Hat, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+""" SSH connection multiplexing for the duration of a run.
+
+enable() makes git (through GIT_SSH_COMMAND) and the gerrit commands
+share one ControlMaster connection per user and host. The control
+sockets live in a private directory, the masters are stopped and the
+directory removed when the process that enabled it exits.
+"""
+
+import os
+import atexit
+import shutil
+import logging
+import tempfile
+import subprocess
+
+from sfrdo import config
+
+
+_STATE = {}
+
+
+def _options():
+    return ['-o', 'ControlMaster=auto',
+            '-o', 'ControlPersist=%s' % config.ssh_mux_persist,
+            '-o', 'ControlPath=%s' % os.path.join(_STATE['dir'],
+                                                  '%r@%h:%p')]
+
+
+def ssh_command():
+    """ Return the ssh command line to use, multiplexed if enabled """
+    if 'dir' not in _STATE:
+        return 'ssh'
+    return ' '.join(['ssh'] + ["'%s'" % o for o in _options()])
+
+
+def count_session():
+    """ Record an ssh session started without GIT_SSH_COMMAND """
+    if 'dir' in _STATE:
+        with open(_STATE['counter'], 'a') as fd:
+            fd.write('.')
+
+
+def enable():
+    """ Multiplex the ssh connections of this process and its children
+
+    Does nothing if disabled in config or if GIT_SSH_COMMAND or GIT_SSH
+    is already set by the user (GIT_SSH_COMMAND would take precedence
+    over the wrapper of GIT_SSH).
+    """
+    if not config.ssh_mux or 'dir' in _STATE or \
+            'GIT_SSH_COMMAND' in os.environ or 'GIT_SSH' in os.environ:
+        return
+    # Unix socket paths are short, keep the directory near the root
+    _STATE['dir'] = tempfile.mkdtemp(prefix='sfrdo-ssh-')
+    _STATE['counter'] = os.path.join(_STATE['dir'], 'sessions')
+    _STATE['pid'] = os.getpid()
+    # git appends "$@" to the command when it holds shell syntax
+    os.environ['GIT_SSH_COMMAND'] = "printf . >> '%s'; exec %s" % (
+        _STATE['counter'], ssh_command())
+    # Avoid the "ssh -G" probe git does to guess the ssh flavor
+    os.environ['GIT_SSH_VARIANT'] = 'ssh'
+    atexit.register(disable)
+
+
+def disable():
+    """ Stop the masters and remove the control sockets """
+    if 'dir' not in _STATE or _STATE['pid'] != os.getpid():
+        return
+    path = _STATE.pop('dir')
+    os.environ.pop('GIT_SSH_COMMAND', None)
+    os.environ.pop('GIT_SSH_VARIANT', None)
+    sessions = 0
+    if os.path.isfile(_STATE['counter']):
+        sessions = os.path.getsize(_STATE['counter'])
+    sockets = [s for s in os.listdir(path) if s != 'sessions']
+    with open(os.devnull, 'w') as devnull:
+        for sock in sockets:
+            # The host is not used when the socket path is explicit
+            subprocess.call(['ssh', '-o', 'ControlPath=%s' %
+                             os.path.join(path, sock), '-O', 'exit', sock],
+                            stdout=devnull, stderr=devnull)
+    shutil.rmtree(path, ignore_errors=True)
+    saved = sessions - len(sockets) if sockets else 0
+    logging.debug("ssh: %s sessions over %s connections, %s handshakes "
+                  "saved" % (sessions, len(sockets), saved))
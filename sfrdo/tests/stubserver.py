@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016 Red Hat, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+""" Stub managesf HTTP server for the tests and benchmarks.
+
+Requests are recorded in order as (method, path, body) and answered
+from the routes dict {(method, path): (status, body)}, with 200 and an
+empty JSON object by default. Logins on /auth/login get a cookie.
+"""
+
+import json
+import socket
+import threading
+import BaseHTTPServer
+import SocketServer
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # One write per response, else delayed ACKs add 40ms per request
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.server.conns.append(self.request)
+
+    def _handle(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else ''
+        path = self.path.split('?')[0]
+        if path == '/auth/login':
+            self.send_response(303)
+            self.send_header('Set-Cookie', 'auth_pubtkt=%s' % (
+                'uid%3Dadmin%3Bvaliduntil%3D9999999999%3Bsig%3Dstub'))
+            self.send_header('Location', '/')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.server.requests.append((self.command, path, body))
+        status, content = self.server.routes.get((self.command, path),
+                                                 (200, '{}'))
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_GET = do_PUT = do_POST = do_DELETE = do_PATCH = _handle
+
+
+class _Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Kept alive connections of the clients reset on exit
+        pass
+
+
+class StubServer(object):
+    def __init__(self):
+        self.server = _Server(('127.0.0.1', 0), _Handler)
+        self.server.requests = []
+        self.server.routes = {}
+        self.server.conns = []
+        self.requests = self.server.requests
+        self.routes = self.server.routes
+        self.host = '127.0.0.1:%s' % self.server.server_address[1]
+        self.url = 'http://%s' % self.host
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       kwargs={'poll_interval': 0.05})
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        # End the kept alive connections, and so their threads
+        for conn in self.server.conns:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+
+    def json_requests(self):
+        """ Return the recorded requests with their body decoded """
+        return [(m, p, json.loads(b) if b else None)
+                for m, p, b in self.requests]
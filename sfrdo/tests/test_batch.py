@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016 Red Hat, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+import unittest
+
+from sfrdo import batch
+
+
+def step(cmdargs, workdir, rdoinfo, step):
+    if step == 'boom':
+        raise ValueError('boom')
+    if step == 'exit':
+        sys.exit(2)
+    return step != 'bad'
+
+
+def where(cmdargs, workdir, rdoinfo):
+    return workdir
+
+
+# (task_id, project, deps, extra) in dependency order
+TASKS = [
+    ('a1', 'a', [], {'step': 'ok'}),
+    ('a2', 'a', ['a1'], {'step': 'ok'}),
+    ('b1', 'b', [], {'step': 'bad'}),
+    ('b2', 'b', ['b1'], {'step': 'ok'}),
+    ('b3', 'b', ['b2'], {'step': 'ok'}),
+    ('c1', 'c', [], {'step': 'boom'}),
+    ('c2', 'c', ['c1'], {'step': 'ok'}),
+    ('d1', 'd', [], {'step': 'exit'}),
+    ('d2', 'd', ['d1', 'a2'], {'step': 'ok'}),
+]
+
+
+class TestRunGraph(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.kargs = {'cmdargs': argparse.Namespace(name=None),
+                      'workdir': self.workdir, 'rdoinfo': None}
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def run_graph(self, jobs):
+        results = {}
+        for task_id, project, result, output, error in batch.run_graph(
+                step, TASKS, self.kargs, jobs):
+            results[task_id] = (project, result, error)
+        return results
+
+    def test_sequential(self):
+        results = self.run_graph(1)
+        self.assertEqual(results, {
+            'a1': ('a', True, None),
+            'a2': ('a', True, None),
+            'b1': ('b', False, None),
+            # Skipped with their dependencies
+            'b2': ('b', None, batch.SKIPPED),
+            'b3': ('b', None, batch.SKIPPED),
+            # Exceptions are reported, not raised
+            'c1': ('c', None, 'ValueError: boom'),
+            'c2': ('c', None, batch.SKIPPED),
+            'd1': ('d', None, 'SystemExit: 2'),
+            'd2': ('d', None, batch.SKIPPED)})
+
+    def test_parallel(self):
+        self.assertEqual(self.run_graph(3), self.run_graph(1))
+
+    def test_order(self):
+        order = [task_id for task_id, _, _, _, _ in batch.run_graph(
+            step, TASKS, self.kargs, 1)]
+        self.assertEqual(order, [t[0] for t in TASKS])
+        order, skipped = [], []
+        for task_id, _, _, _, error in batch.run_graph(
+                step, TASKS, self.kargs, 3):
+            order.append(task_id)
+            if error == batch.SKIPPED:
+                skipped.append(task_id)
+        for task_id, _, deps, _ in TASKS:
+            if task_id not in skipped:
+                # Started once the tasks they depend on completed
+                self.assertTrue(all(order.index(d) < order.index(task_id)
+                                    for d in deps))
+
+    def test_worker_workdir(self):
+        tasks = [(p, p, [], {}) for p in 'abcd']
+        for _, _, workdir, _, error in batch.run_graph(
+                where, tasks, self.kargs, 2):
+            self.assertIsNone(error)
+            self.assertEqual(os.path.dirname(workdir), self.workdir)
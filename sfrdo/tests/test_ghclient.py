@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016 Red Hat, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import shutil
+import tempfile
+import unittest
+
+from sfrdo import config
+from sfrdo import ghclient
+from sfrdo.tests.stubserver import StubServer
+
+
+class TestGithubClient(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer().start()
+        self.api = ghclient.API
+        ghclient.API = self.server.url
+        self.userdir = config.userdir
+        config.userdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(config.userdir)
+        config.userdir = self.userdir
+        ghclient.API = self.api
+        self.server.stop()
+
+    def test_cache_per_token(self):
+        self.server.routes[('GET', '/repos/o/r')] = (200, '{"private": 1}')
+        for token in ('a', 'b', 'a'):
+            gh = ghclient.GithubClient(token, cache_ttl=60)
+            self.assertEqual(gh.get('/repos/o/r'), {'private': 1})
+        # The second client of token a answers from the cache of the first
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(gh.stats['cached'], 1)
+
+    def test_concurrent_stats(self):
+        gh = ghclient.GithubClient(jobs=8, cache_ttl=0)
+        gh.buckets['core'] = ghclient.TokenBucket(1000, 1000)
+        gh.map(lambda i: gh.get('/repos/o/r%d' % i), range(64))
+        self.assertEqual(gh.stats['requests'], 64)
+        self.assertEqual(len(self.server.requests), 64)
+
+    def test_repo_exists(self):
+        self.server.routes[('GET', '/orgs/o/repos')] = (
+            200, '[{"name": "Listed"}]')
+        self.server.routes[('GET', '/repos/o/missing')] = (404, '{}')
+        gh = ghclient.GithubClient()
+        self.assertTrue(gh.repo_exists('o', 'listed'))
+        # Renamed, answered by the repository API
+        self.assertTrue(gh.repo_exists('o', 'renamed'))
+        self.assertFalse(gh.repo_exists('o', 'missing'))
+        self.assertEqual([r[1] for r in self.server.requests], [
+            '/orgs/o/repos', '/repos/o/renamed', '/repos/o/missing'])
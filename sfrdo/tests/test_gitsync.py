@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016 Red Hat, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from rdopkg.helpers import cdir
+from rdopkg.utils.cmd import git
+from rdopkg.utils.exception import CommandFailed
+
+from sfrdo import config
+from sfrdo import gitrefs
+from sfrdo import gitsync
+
+
+class TestSyncBranches(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.userdir = config.userdir
+        config.userdir = os.path.join(self.root, 'home')
+        for var in ('AUTHOR', 'COMMITTER'):
+            os.environ.setdefault('GIT_%s_NAME' % var, 'sfrdo')
+            os.environ.setdefault('GIT_%s_EMAIL' % var, 'sfrdo@localhost')
+        self.upstream = os.path.join(self.root, 'upstream.git')
+        self.local = os.path.join(self.root, 'local.git')
+        git('init', '--bare', '-q', self.upstream)
+        git('init', '--bare', '-q', self.local)
+        work = os.path.join(self.root, 'work')
+        git('init', '-q', work)
+        with cdir(work):
+            for branch in ('master', 'stable'):
+                git('checkout', '-q', '--orphan', branch)
+                with open('file', 'w') as fd:
+                    fd.write(branch)
+                git('add', 'file')
+                git('commit', '-q', '-m', branch)
+            git('push', '-q', self.upstream, 'master', 'stable')
+
+    def tearDown(self):
+        config.userdir = self.userdir
+        gitrefs.invalidate(self.local)
+        gitrefs.invalidate(self.upstream)
+        shutil.rmtree(self.root)
+
+    def sync(self):
+        updates = [(b, self.upstream, b, None) for b in ('master', 'stable')]
+        results = gitsync.sync_branches(self.local, updates)
+        for branch in ('master', 'stable'):
+            self.assertIsNone(results[branch][2])
+            self.assertEqual(gitrefs.branch_sha(self.local, branch),
+                             gitrefs.branch_sha(self.upstream, branch))
+
+    def test_atomic(self):
+        self.sync()
+
+    def test_not_atomic_remote(self):
+        with cdir(self.local):
+            git('config', 'receive.advertiseAtomic', 'false')
+        self.sync()
+
+    def test_not_atomic_partial_failure(self):
+        self.sync()
+        work = os.path.join(self.root, 'work')
+        with cdir(work):
+            for branch in ('master', 'stable'):
+                git('checkout', '-q', branch)
+                git('commit', '-q', '--allow-empty', '-m', 'new')
+            git('push', '-q', self.upstream, 'master', 'stable')
+        with cdir(self.local):
+            git('config', 'receive.advertiseAtomic', 'false')
+        hook = os.path.join(self.local, 'hooks', 'update')
+        with open(hook, 'w') as fd:
+            fd.write('#!/bin/sh\ntest "$1" != refs/heads/stable\n')
+        os.chmod(hook, 0755)
+        gitrefs.invalidate(self.upstream)
+        updates = [(b, self.upstream, b, gitrefs.branch_sha(self.local, b))
+                   for b in ('master', 'stable')]
+        results = gitsync.sync_branches(self.local, updates)
+        sha, difflog, error = results['master']
+        self.assertIsNone(error)
+        self.assertEqual(len(difflog), 1)
+        self.assertEqual(gitrefs.branch_sha(self.local, 'master'), sha)
+        self.assertIsNotNone(results['stable'][2])
+        self.assertNotEqual(gitrefs.branch_sha(self.local, 'stable'),
+                            results['stable'][0])
+
+    def test_push_error(self):
+        # Errors other than the atomic support are not retried
+        self.assertRaises(CommandFailed, gitsync._push,
+                          os.path.join(self.root, 'missing.git'),
+                          ['HEAD:refs/heads/a', 'HEAD:refs/heads/b'])
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+class TestBranchPlan(unittest.TestCase):
+    def setUp(self):
+        gitrefs._SNAPSHOTS.update({
+            'upstream': {'refs/heads/master': 'a1',
+                         'refs/heads/stable/liberty': 'a2'},
+            'distgit': {'refs/heads/rpm-master': 'b1'},
+            'mdistgit': {'refs/heads/rpm-master': 'c1',
+                         'refs/heads/rpm-liberty': 'c2'},
+        })
+
+    def tearDown(self):
+        for url in ('upstream', 'distgit', 'mdistgit', 'missing'):
+            gitrefs.invalidate(url)
+
+    def test_resolve(self):
+        plan = gitsync.BranchPlan()
+        plan.add('upstream', 'master', 'master')
+        plan.add('distgit', 'rpm-master', 'rpm-master')
+        plan.add('mdistgit', 'rpm-master', 'rpm-master')
+        plan.add('mdistgit', 'rpm-liberty', 'rpm-liberty')
+        plan.add('distgit', 'rpm-liberty', 'rpm-liberty')
+        plan.add('upstream', 'stable/kilo', 'stable/kilo')
+        self.assertEqual(plan.resolve(), {
+            'master': ('upstream', 'master', 'a1'),
+            # The last source added that exists wins
+            'rpm-master': ('mdistgit', 'rpm-master', 'c1'),
+            'rpm-liberty': ('mdistgit', 'rpm-liberty', 'c2'),
+            'stable/kilo': None})
+
+    def test_resolve_lists_needed_remotes(self):
+        gitrefs._SNAPSHOTS['missing'] = {}
+        plan = gitsync.BranchPlan()
+        plan.add('unlisted', 'master', 'master')
+        plan.add('missing', 'master', 'master')
+        plan.add('upstream', 'master', 'master')
+        self.assertEqual(plan.resolve(),
+                         {'master': ('upstream', 'master', 'a1')})
+        # Sources of lower precedence are not listed
+        self.assertNotIn('unlisted', gitrefs._SNAPSHOTS)
+        self.assertEqual(plan.entries(), [
+            ('unlisted', 'master', 'master'),
+            ('missing', 'master', 'master'),
+            ('upstream', 'master', 'master')])
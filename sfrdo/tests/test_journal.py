@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016 Red Hat, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from sfrdo import journal
+
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, 'journal.jsonl')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def journal(self, key='import --type=core', resume=True):
+        return journal.Journal(self.path, key, resume=resume)
+
+    def records(self):
+        with open(self.path) as fd:
+            return [json.loads(line) for line in fd]
+
+    def fetch(self, projects):
+        def fetch():
+            self.fetched = True
+            return projects
+        self.fetched = False
+        return fetch
+
+    def test_resume(self):
+        jnl = self.journal(resume=False)
+        self.assertEqual(jnl.projects(self.fetch(['foo', 'bar'])),
+                         ['foo', 'bar'])
+        jnl.done('foo', 'distgit')
+        jnl.done('bar')
+        jnl = self.journal()
+        # The project list is not fetched again
+        self.assertEqual(jnl.projects(self.fetch(['baz'])), ['foo', 'bar'])
+        self.assertFalse(self.fetched)
+        self.assertTrue(jnl.is_done('foo', 'distgit'))
+        self.assertFalse(jnl.is_done('foo', 'mirror'))
+        self.assertEqual(jnl.pending(['foo', 'bar']), ['foo'])
+        # Other keys are not resumed
+        jnl = self.journal('import --type=client')
+        self.assertEqual(jnl.projects(self.fetch(['baz'])), ['baz'])
+        self.assertTrue(self.fetched)
+        self.assertFalse(jnl.is_done('bar'))
+
+    def test_new_run(self):
+        jnl = self.journal(resume=False)
+        jnl.projects(self.fetch(['foo']))
+        jnl.done('foo')
+        jnl = self.journal(resume=False)
+        self.assertEqual(jnl.projects(self.fetch(['bar'])), ['bar'])
+        self.assertFalse(jnl.is_done('foo'))
+        self.assertEqual(self.journal().projects(self.fetch([])), ['bar'])
+
+    def test_compaction(self):
+        other = self.journal('sync_maints --type=core', resume=False)
+        other.projects(self.fetch(['baz']))
+        other.done('baz')
+        for projects in (['foo'], ['bar']):
+            jnl = self.journal(resume=False)
+            jnl.projects(self.fetch(projects))
+            jnl.done(projects[0])
+        # Only the last run of each key is kept
+        self.assertEqual(
+            [(r['key'], r['type'], r.get('project')) for r in self.records()],
+            [('sync_maints --type=core', 'start', None),
+             ('sync_maints --type=core', 'done', 'baz'),
+             ('import --type=core', 'start', None),
+             ('import --type=core', 'done', 'bar')])
+
+    def test_truncated_line(self):
+        jnl = self.journal(resume=False)
+        jnl.projects(self.fetch(['foo', 'bar']))
+        jnl.done('foo')
+        with open(self.path, 'a') as fd:
+            # Interrupted while writing the done record of bar
+            fd.write('{"type": "done", "proj')
+        jnl = self.journal()
+        self.assertEqual(jnl.pending(jnl.projects(self.fetch([]))), ['bar'])
+        # The next record starts on a line of its own
+        jnl.done('bar')
+        self.assertTrue(self.journal().is_done('bar'))
+
+    def test_reset(self):
+        jnl = self.journal(resume=False)
+        jnl.projects(self.fetch(['foo', 'bar']))
+        jnl.done('foo', 'distgit')
+        jnl.done('foo', 'mirror')
+        jnl.done('bar', 'distgit')
+        jnl.reset('foo')
+        self.assertFalse(jnl.is_done('foo', 'distgit'))
+        jnl = self.journal()
+        self.assertFalse(jnl.is_done('foo', 'distgit'))
+        self.assertFalse(jnl.is_done('foo', 'mirror'))
+        self.assertTrue(jnl.is_done('bar', 'distgit'))
+        # Done again after the reset
+        jnl.done('foo', 'distgit')
+        self.assertTrue(self.journal().is_done('foo', 'distgit'))
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016 Red Hat, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+import shutil
+import argparse
+import tempfile
+import unittest
+
+from sfrdo import config
+from sfrdo import journal
+from sfrdo import main
+from sfrdo.tests.stubserver import StubServer
+from sfrdo.tests.test_rdoinfoutils import package
+
+
+def details(ptl, core):
+    return {'groups': {
+        'ptl': {'members': [{'email': m} for m in ptl]},
+        'core': {'members': [{'email': m} for m in core]}}}
+
+
+class TestSyncMaints(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer().start()
+        self.root = tempfile.mkdtemp()
+        self.rpmfactory = config.rpmfactory
+        config.rpmfactory = self.server.host
+        self.jnl = journal.Journal(os.path.join(self.root, 'journal.jsonl'),
+                                   'sync_maints --type=core')
+        self.jnl.projects(lambda: ['nova', 'glance'])
+        synced = [config.service_user_mail, 'nova@example.com']
+        project_details = {
+            'nova': details(synced, synced),
+            'nova-distgit': details(synced, synced),
+            'glance': details([config.service_user_mail], synced),
+            'glance-distgit': details(synced, synced)}
+        rdoinfo = {'packages': [
+            package('nova', 'git://git.openstack.org/openstack/nova'),
+            package('glance', 'git://git.openstack.org/openstack/glance')]}
+        for pkg in rdoinfo['packages']:
+            pkg['maintainers'] = ['nova@example.com']
+        self.kargs = {'cmdargs': argparse.Namespace(dry_run=False, jobs=2),
+                      'workdir': self.root, 'rdoinfo': rdoinfo,
+                      'project_details': project_details}
+
+    def tearDown(self):
+        config.rpmfactory = self.rpmfactory
+        self.server.stop()
+        shutil.rmtree(self.root)
+
+    def test_synced(self):
+        self.assertEqual(main.sync_maints(self.kargs, ['nova', 'glance'],
+                                          self.jnl), [])
+        self.assertEqual(self.jnl.pending(['nova', 'glance']), [])
+        self.assertEqual(self.server.requests[0][:2], (
+            'PUT', '/manage/project/membership/glance/nova@example.com/'))
+
+    def test_failed_op(self):
+        self.server.routes[(
+            'PUT', '/manage/project/membership/glance/nova@example.com/')] = (
+            500, '"error"')
+        self.assertEqual(main.sync_maints(self.kargs, ['nova', 'glance'],
+                                          self.jnl), ['glance'])
+        self.assertEqual(self.jnl.pending(['nova', 'glance']), ['glance'])
+        resumed = journal.Journal(self.jnl.path, self.jnl.key, resume=True)
+        self.assertEqual(resumed.pending(resumed.projects(None)), ['glance'])
+
+    def test_dry_run(self):
+        self.kargs['cmdargs'].dry_run = True
+        main.sync_maints(self.kargs, ['nova', 'glance'], self.jnl)
+        self.assertEqual(self.server.requests, [])
+        self.assertEqual(self.jnl.pending(['nova', 'glance']),
+                         ['nova', 'glance'])
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+class TestMaintsSyncPlan(unittest.TestCase):
+    def test_plan(self):
+        memberships = {
+            'foo': (['old@x', main.SF_ADMIN_MAIL], ['ptl@x', 'old@x']),
+            'bar': ([], []),
+            'baz': (['ptl@x'], ['ptl@x']),
+        }
+        self.assertEqual(main.maints_sync_plan(memberships, set(['ptl@x'])), [
+            ('add', 'bar', 'ptl@x', ['ptl-group', 'core-group']),
+            # The admin is kept
+            ('remove', 'foo', 'old@x', ['ptl-group']),
+            ('remove', 'foo', 'old@x', ['core-group']),
+            ('add', 'foo', 'ptl@x', ['ptl-group'])])
+
+    def test_in_sync(self):
+        self.assertEqual(main.maints_sync_plan(
+            {'foo': (['a@x', 'b@x'], ['b@x', 'a@x'])},
+            set(['a@x', 'b@x'])), [])
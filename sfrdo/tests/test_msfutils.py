@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016 Red Hat, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import json
+import base64
+import random
+import time
+import unittest
+
+from sfrdo import config
+from sfrdo import msfutils
+from sfrdo.tests.stubserver import StubServer
+
+
+class TestManageSfUtils(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer().start()
+        self.msf = msfutils.ManageSfUtils(self.server.url, 'admin', 'pass')
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_create_project(self):
+        inv = msfutils.inventory(self.server.host)
+        inv._stale = False
+        self.msf.createProject('python-foo',
+                               {'description': '"Foo library"',
+                                'private': ''})
+        self.assertEqual(self.server.json_requests(), [
+            ('PUT', '/manage/project/python-foo/',
+             {'description': 'Foo library', 'private': True})])
+        self.assertTrue(inv._stale)
+
+    def test_create_namespaced_project(self):
+        self.msf.createProject('openstack/foo')
+        pid = '===' + base64.urlsafe_b64encode('openstack/foo')
+        self.assertEqual(self.server.requests[0][1],
+                         '/manage/project/%s/' % pid)
+
+    def test_create_project_error(self):
+        self.server.routes[('PUT', '/manage/project/foo/')] = (
+            409, '"already exists"')
+        inv = msfutils.inventory(self.server.host)
+        inv._stale = False
+        self.assertRaises(msfutils.SFManagerException,
+                          self.msf.createProject, 'foo')
+        # A failure may still have left something behind
+        self.assertTrue(inv._stale)
+
+    def test_delete_project(self):
+        self.msf.deleteProject('foo')
+        self.assertEqual(self.server.requests,
+                         [('DELETE', '/manage/project/foo/', '')])
+
+    def test_delete_missing_project(self):
+        self.server.routes[('DELETE', '/manage/project/foo/')] = (404, '{}')
+        self.msf.deleteProject('foo')
+
+    def test_delete_project_error(self):
+        self.server.routes[('DELETE', '/manage/project/foo/')] = (500, '{}')
+        self.assertRaises(msfutils.SFManagerException,
+                          self.msf.deleteProject, 'foo')
+
+    def test_add_membership(self):
+        self.msf.addUsertoProjectGroups('foo', 'john@example.com',
+                                        'ptl-group core-group')
+        self.assertEqual(self.server.json_requests(), [
+            ('PUT', '/manage/project/membership/foo/john@example.com/',
+             {'groups': ['ptl-group', 'core-group']})])
+
+    def test_add_membership_error(self):
+        self.server.routes[
+            ('PUT', '/manage/project/membership/foo/john@example.com/')] = (
+            400, '"unknown user"')
+        self.assertRaises(msfutils.SFManagerException,
+                          self.msf.addUsertoProjectGroups,
+                          'foo', 'john@example.com', 'core-group')
+
+    def test_remove_membership(self):
+        self.msf.deleteUserFromProjectGroup('foo', 'john@example.com',
+                                            'core-group')
+        self.assertEqual(self.server.requests, [
+            ('DELETE',
+             '/manage/project/membership/foo/john@example.com/core-group/',
+             '')])
+
+    def test_remove_membership_error(self):
+        path = '/manage/project/membership/foo/john@example.com/core-group/'
+        self.server.routes[('DELETE', path)] = (403, '"forbidden"')
+        self.assertRaises(msfutils.SFManagerException,
+                          self.msf.deleteUserFromProjectGroup,
+                          'foo', 'john@example.com', 'core-group')
+
+    def test_project_details(self):
+        details = {'foo': {'groups': {'ptl': {}}, 'config': 'x'},
+                   'bar': {'groups': {}}}
+        self.server.routes[('GET', '/manage/project/')] = (
+            200, json.dumps(details))
+        self.assertEqual(self.msf.listAllProjectDetails(), details)
+        self.assertEqual(self.msf.listAllProjectDetails(['foo', 'baz']),
+                         {'foo': {'groups': {'ptl': {}}}})
+
+
+class TestReplication(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer().start()
+        self.msf = msfutils.ManageSfUtils(self.server.url, 'admin', 'pass')
+        self.msf.github_api = self.server.url
+        self.msf.keys = [('PRIVATE', 'PUBLIC')]
+        self.reload_wait = config.replication_reload_wait
+        config.replication_reload_wait = 0
+
+    def tearDown(self):
+        config.replication_reload_wait = self.reload_wait
+        self.server.stop()
+
+    def test_fork(self):
+        self.server.routes[('GET', '/repos/rdo-packages/bar/branches')] = (
+            200, '[{"name": "master"}]')
+        self.msf.replicateProjectGithub(
+            'foo', 'https://github.com/openstack/bar', 'token',
+            need_fork=True)
+        self.assertEqual([r[:2] for r in self.server.requests], [
+            ('POST', '/repos/openstack/bar/forks'),
+            # Copied before being renamed
+            ('GET', '/repos/rdo-packages/bar/branches'),
+            ('PATCH', '/repos/rdo-packages/bar'),
+            ('GET', '/repos/rdo-packages/foo'),
+            ('POST', '/repos/rdo-packages/foo/keys'),
+            ('DELETE', '/manage/replication/foo/'),
+            ('PUT', '/manage/replication/foo/url/'),
+            ('PUT', '/manage/replication/foo/projects/'),
+            ('PUT', '/manage/sshconfig/alias_gh_foo/'),
+            ('POST', '/manage/replication/')])
+
+    def test_batch(self):
+        for repo in ('foo', 'bar'):
+            self.msf.keys.append(('PRIVATE', 'PUBLIC'))
+            self.msf.replicateProjectGithub(repo, None, 'token',
+                                            trigger=False)
+        self.assertEqual(self.msf.pending, ['foo', 'bar'])
+        self.msf.triggerReplication()
+        self.assertEqual(self.msf.pending, [])
+        self.assertEqual(
+            [r[:2] for r in self.server.requests].count(
+                ('POST', '/manage/replication/')), 1)
+
+    def test_wait_reload_listed(self):
+        class Gerrit(object):
+            listed = [set(), set(['foo']), set(['foo', 'bar', 'baz'])]
+
+            def replication_remotes(self):
+                return self.listed.pop(0)
+
+        config.replication_reload_wait = 30
+        msfutils.wait_replication_reload(time.time(), ['foo', 'bar'],
+                                         Gerrit())
+        self.assertEqual(Gerrit.listed, [])
+
+    def test_wait_reload_not_loaded(self):
+        class Gerrit(object):
+            def replication_remotes(self):
+                return set(['foo'])
+
+        self.assertRaises(msfutils.SFManagerException,
+                          msfutils.wait_replication_reload,
+                          time.time(), ['foo', 'bar'], Gerrit())
+
+    def test_wait_reload_not_listed(self):
+        class Gerrit(object):
+            def replication_remotes(self):
+                return None
+
+        config.replication_reload_wait = 0.2
+        start = time.time()
+        msfutils.wait_replication_reload(start, ['foo'], Gerrit())
+        self.assertGreaterEqual(time.time() - start, 0.2)
+
+    def test_github_error(self):
+        self.server.routes[('POST', '/orgs/rdo-packages/repos')] = (
+            422, '{"message": "name already exists"}')
+        self.assertRaises(msfutils.SFManagerException,
+                          self.msf.replicateProjectGithub,
+                          'foo', None, 'token')
+        self.assertEqual(self.msf.pending, [])
+
+
+class TestIterJsonObject(unittest.TestCase):
+    doc = json.dumps({
+        'a': -25000000000.0, 'b': 1e+30, 'c': 12, 'd': [1.5, 2],
+        'e': {'groups': {'ptl': {'members': ['x@example.com']}}},
+        'f': 'str,}"', 'g': None, 'h': True, 'i': -0.25e-3}, indent=1)
+
+    def parse(self, chunks):
+        return dict(msfutils.iter_json_object(chunks))
+
+    def test_splits(self):
+        expected = json.loads(self.doc)
+        for i in range(len(self.doc) + 1):
+            self.assertEqual(self.parse([self.doc[:i], self.doc[i:]]),
+                             expected, "split at %d" % i)
+
+    def test_number_split(self):
+        doc = '{"a": -25000000000.0}'
+        for i in (1, 19):
+            self.assertEqual(self.parse([doc[:i], doc[i:]]),
+                             {'a': -25000000000.0})
+
+    def test_random_chunks(self):
+        rand = random.Random(42)
+        expected = json.loads(self.doc)
+        for _ in range(200):
+            chunks = []
+            pos = 0
+            while pos < len(self.doc):
+                size = rand.randint(1, 8)
+                chunks.append(self.doc[pos:pos + size])
+                pos += size
+            self.assertEqual(self.parse(chunks), expected)
+
+    def test_empty(self):
+        self.assertEqual(self.parse(['{', ' }']), {})
+
+    def test_invalid(self):
+        for doc in ('{"a": 1', '{"a": 1x}', '{"a" 1}', '[1]', ''):
+            self.assertRaises(ValueError, self.parse, [doc])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016 Red Hat, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import unittest
+
+from sfrdo import rdoinfoutils
+
+
+def package(project, upstream, **kwargs):
+    pkg = {'project': project, 'upstream': upstream,
+           'distgit': 'ssh://pkgs.example.com/%s.git' % project,
+           'master-distgit': 'git://example.com/%s-distgit' % project,
+           'maintainers': ['%s@example.com' % project]}
+    pkg.update(kwargs)
+    return pkg
+
+
+class TestRdoInfoIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = rdoinfoutils.RdoInfoIndex({'packages': [
+            package('nova', 'git://git.openstack.org/openstack/nova',
+                    conf='core'),
+            package('oslo-config',
+                    'git://git.openstack.org/openstack/oslo.config',
+                    conf='lib'),
+            package('python-novaclient',
+                    'git://git.openstack.org/openstack/python-novaclient',
+                    conf='client'),
+            package('novaclient',
+                    'git://git.openstack.org/openstack/novaclient'),
+            package('glance_store',
+                    'git://git.openstack.org/openstack/glance_store',
+                    conf='lib'),
+            package('nova', 'git://example.com/duplicate/nova'),
+        ]})
+
+    def test_project_name(self):
+        infos = self.index.get('nova')
+        self.assertEqual(infos.name, 'nova')
+        self.assertEqual(infos.upstream,
+                         'git://git.openstack.org/openstack/nova')
+        self.assertEqual(infos.sfdistgit, 'nova-distgit')
+        self.assertEqual(infos.distgit, 'git://pkgs.example.com/nova.git')
+        self.assertEqual(infos.conf, 'core')
+
+    def test_upstream_suffix(self):
+        self.assertEqual(self.index.get('oslo.config').name, 'oslo-config')
+        # The first package whose upstream ends with the name wins, as
+        # with the scan of rdoinfo
+        self.assertEqual(self.index.get('client').name, 'python-novaclient')
+        self.assertEqual(self.index.get('novaclient').name, 'novaclient')
+
+    def test_fixes(self):
+        infos = self.index.get('glance_store')
+        fixes = rdoinfoutils.RDOINFOS_FIXES['glance_store']
+        self.assertEqual(infos.distgit, fixes['distgit'])
+        self.assertEqual(infos.conf, fixes['conf'])
+
+    def test_not_found(self):
+        self.assertRaises(Exception, self.index.get, 'swift')
+
+    def test_projects_of_type(self):
+        self.assertEqual(self.index.projects_of_type('lib'),
+                         ['oslo-config', 'glance_store'])
+        self.assertEqual(self.index.projects_of_type('None'),
+                         ['novaclient', 'nova'])
+        self.assertEqual(self.index.projects_of_type('unknown'), [])
+        self.assertEqual(len(self.index.projects_of_type('All')), 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
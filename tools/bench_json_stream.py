@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016 Red Hat, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+""" Peak memory and time of parsing a managesf project listing.
+
+Writes a synthetic GET /manage/project/ response of the given number of
+projects, then parses it in a fresh process per method:
+
+  loads   json.loads of the whole response (listAllProjectDetails())
+  stream  iter_json_object over 64KB chunks, keeping only the groups
+          of a few projects (listAllProjectDetails(names))
+
+    python tools/bench_json_stream.py [projects]
+"""
+
+import os
+import sys
+import json
+import time
+import resource
+import tempfile
+import subprocess
+
+from sfrdo import msfutils
+
+
+CHUNK = 64 * 1024
+
+
+def dump(path, projects):
+    members = [{'username': 'user%d' % i, 'email': 'user%d@example.com' % i,
+                'name': 'User %d' % i, 'id': 1000 + i} for i in range(20)]
+    with open(path, 'w') as fd:
+        fd.write('{')
+        for i in range(projects):
+            name = 'openstack/project-%d-distgit' % i
+            details = {'name': name, 'description': 'Project %d' % i,
+                       'id': i, 'score': -25000000000.0 + i,
+                       'groups': {'ptl': {'name': '%s-ptl' % name,
+                                          'members': members[:3]},
+                                  'core': {'name': '%s-core' % name,
+                                           'members': members}}}
+            fd.write('%s%s: %s' % (',' if i else '', json.dumps(name),
+                                   json.dumps(details)))
+        fd.write('}')
+
+
+def chunks(path):
+    with open(path) as fd:
+        while True:
+            data = fd.read(CHUNK)
+            if not data:
+                return
+            yield data
+
+
+def measure(method, path):
+    names = set(['openstack/project-%d-distgit' % i for i in (0, 7, 42)])
+    base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.time()
+    if method == 'loads':
+        with open(path) as fd:
+            infos = json.loads(fd.read())
+        found = dict((n, {'groups': infos[n]['groups']})
+                     for n in names if n in infos)
+    else:
+        found = dict((n, {'groups': d['groups']})
+                     for n, d in msfutils.iter_json_object(chunks(path))
+                     if n in names)
+    elapsed = time.time() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print json.dumps({'time': elapsed, 'peak': peak, 'base': base,
+                      'found': len(found)})
+
+
+def main():
+    if len(sys.argv) == 4 and sys.argv[1] == '--measure':
+        return measure(sys.argv[2], sys.argv[3])
+    projects = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    fd, path = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    try:
+        dump(path, projects)
+        print "%d projects, %.1fMB response" % (
+            projects, os.path.getsize(path) / 1024.0 ** 2)
+        for method in ('loads', 'stream'):
+            res = json.loads(subprocess.check_output(
+                [sys.executable, __file__, '--measure', method, path]))
+            print "%-7s %6.2fs  peak RSS %6.1fMB (%.1fMB before parsing)" % (
+                method, res['time'], res['peak'] / 1024.0,
+                res['base'] / 1024.0)
+    finally:
+        os.unlink(path)
+
+
+if __name__ == '__main__':
+    main()
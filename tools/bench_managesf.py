@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016 Red Hat, Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+""" Compare the managesf REST client with the sfmanager subprocesses.
+
+Both clients run the same calls (project create, membership add and
+remove, project delete) against a local stub managesf server, so the
+numbers measure the client side cost of a call: process start, login
+and HTTP round trip for sfmanager, HTTP round trip only for REST.
+
+Then the REST client configures the Github replication of the mirror
+and distgit repositories of a few projects, the stub also answering the
+Github API and Gerrit ssh commands being faked:
+
+- each repository triggered on its own, waiting for Gerrit to reload
+  the config each time, as before;
+- all repositories triggered once, after config.replication_reload_wait;
+- all repositories triggered once, as soon as Gerrit lists them.
+
+    python tools/bench_managesf.py [projects [replications [wait]]]
+
+The sfmanager column is skipped when sfmanager is not in the PATH. The
+reload wait defaults to config.replication_reload_wait.
+"""
+
+import sys
+import time
+import distutils.spawn
+
+from sfrdo import config
+from sfrdo import msfutils
+from sfrdo.tests.stubserver import StubServer
+
+
+def scenario(msf, projects):
+    start = time.time()
+    for i in range(projects):
+        name = 'bench-%d' % i
+        msf.createProject(name)
+        msf.addUsertoProjectGroups(name, 'john@example.com', 'core-group')
+        msf.deleteUserFromProjectGroup(name, 'john@example.com',
+                                       'core-group')
+        msf.deleteProject(name)
+    return time.time() - start
+
+
+class FakeGerrit(object):
+    """ Answer the Gerrit replication commands, listing the remotes
+    configured on the stub: the replication plugin reloads a changed
+    config when it is used """
+
+    def __init__(self, server):
+        self.server = server
+
+    def exe(self, cmd):
+        if 'replication list' in cmd:
+            return ''.join(
+                'Remote: %s\n' % path.split('/')[3]
+                for method, path, body in self.server.requests
+                if method == 'PUT' and path.startswith(
+                    '/manage/replication/') and path.endswith('/url/')), 0
+        return '', 0
+
+
+def replication(server, projects, mode):
+    msf = msfutils.ManageSfUtils(server.url, 'admin', 'pass')
+    msf.github_api = server.url
+    msf.prepare_keys(2 * projects)
+    fake = FakeGerrit(server)
+    orig = msfutils.GerritSfUtils.exe
+    msfutils.GerritSfUtils.exe = lambda self, cmd: fake.exe(cmd)
+    ssh_user = 'admin' if mode == 'listed' else None
+    start = time.time()
+    try:
+        for i in range(projects):
+            for repo in ('bench-%d' % i, 'bench-%d-distgit' % i):
+                msf.replicateProjectGithub(repo, None, 'token',
+                                           trigger=False)
+                if mode == 'each':
+                    msf.triggerReplication(ssh_user)
+        if mode != 'each':
+            msf.triggerReplication(ssh_user)
+    finally:
+        msfutils.GerritSfUtils.exe = orig
+    return time.time() - start
+
+
+def main():
+    projects = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    replicated = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    if len(sys.argv) > 3:
+        config.replication_reload_wait = float(sys.argv[3])
+    calls = projects * 4
+    server = StubServer().start()
+    try:
+        clients = [('rest', msfutils.ManageSfUtils)]
+        if distutils.spawn.find_executable('sfmanager'):
+            clients.append(('sfmanager', msfutils.ManageSfCliUtils))
+        else:
+            print "sfmanager not found, only REST is measured"
+        for name, cls in clients:
+            del server.requests[:]
+            elapsed = scenario(cls(server.url, 'admin', 'pass'), projects)
+            print "%-10s %4d calls in %6.2fs, %6.1fms per call " \
+                "(%d requests)" % (name, calls, elapsed,
+                                   elapsed * 1000 / calls,
+                                   len(server.requests))
+        modes = [('each', 'triggered per repo'),
+                 ('once', 'triggered once'),
+                 ('listed', 'triggered once listed')]
+        times = {}
+        for mode, label in modes:
+            times[mode] = replication(server, replicated, mode)
+            print "%d projects replicated, %-21s: %6.2fs, %.2fs per " \
+                "project (%ss reload wait)" % (
+                    replicated, label, times[mode], times[mode] / replicated,
+                    config.replication_reload_wait)
+        for mode, label in modes[1:]:
+            print "%-21s saves %.2fs per project" % (
+                label, (times['each'] - times[mode]) / replicated)
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()